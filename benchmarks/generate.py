@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+import json
+import os
+import random
+import click
+
+PROJECT_NAME = 'bench'
+
+
+def header_name(library, index):
+    return os.path.join('lib%d' % library, 'include', 'lib%d_%d.h' % (library, index))
+
+
+def source_name(library, index):
+    return os.path.join('lib%d' % library, 'src', 'lib%d_%d.cpp' % (library, index))
+
+
+def write_file(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def transitive_includes(header, includes, closure):
+    if header not in closure:
+        closure[header] = []
+        seen = {header}
+        for included in includes[header]:
+            for dependency in [included] + transitive_includes(included, includes, closure):
+                if dependency not in seen:
+                    seen.add(dependency)
+                    closure[header].append(dependency)
+    return closure[header]
+
+
+def generate_project(directory, sources=200, headers=100, fan_out=8, libraries=4, extra_files=1000, seed=1):
+    """Generates a synthetic C++ project of libraries with their own sources and headers. Headers include up to two
+    earlier headers of their library and sources include fan_out headers from any library. Every source gets a
+    prepared dependency file next to it for the stub compiler, and the project is written as a .buildsfile.
+    extra_files sources are generated outside of the project to time add and remove. Returns a summary of the
+    generated project."""
+    generator = random.Random(seed)
+    libraries = max(1, libraries)
+    all_headers = [header_name(index % libraries, index // libraries) for index in range(headers)]
+    includes = {}
+    for header in all_headers:
+        library_headers = [other for other in all_headers
+                           if os.path.dirname(other) == os.path.dirname(header) and other < header]
+        includes[header] = generator.sample(library_headers, min(2, len(library_headers)))
+    closure = {}
+    for header in all_headers:
+        guard = os.path.basename(header).replace('.', '_').upper()
+        write_file(os.path.join(directory, header), '#ifndef %s\n#define %s\n%s\nint %s_value();\n#endif\n' % (
+            guard, guard,
+            ''.join('#include "%s"\n' % os.path.basename(included) for included in includes[header]),
+            guard.lower()
+        ))
+        transitive_includes(header, includes, closure)
+
+    def write_source(source, included_headers):
+        dependencies = []
+        for header in included_headers:
+            for dependency in [header] + closure[header]:
+                if dependency not in dependencies:
+                    dependencies.append(dependency)
+        write_file(os.path.join(directory, source), '%s\nint %s() { return 0; }\n' % (
+            ''.join('#include "%s"\n' % os.path.basename(header) for header in included_headers),
+            os.path.basename(source).replace('.', '_')
+        ))
+        write_file(os.path.join(directory, source + '.deps'),
+                   '%s.o: %s\n' % (source, ' '.join([source] + dependencies)))
+
+    files = []
+    for index in range(sources):
+        source = source_name(index % libraries, index // libraries)
+        write_source(source, generator.sample(all_headers, min(fan_out, len(all_headers))))
+        files.append(source)
+    main = 'main.cpp'
+    write_file(os.path.join(directory, main), 'int main() { return 0; }\n')
+    write_file(os.path.join(directory, main + '.deps'), '%s.o: %s\n' % (main, main))
+    files.append(main)
+    extra = []
+    for index in range(extra_files):
+        source = os.path.join('extra', 'extra_%d.cpp' % index)
+        write_source(source, [])
+        extra.append(source)
+
+    configuration = {
+        'projects': {
+            PROJECT_NAME: {
+                'pipeline': 'CPP',
+                'build-settings': {
+                    'include-paths': ['./' + os.path.dirname(header_name(library, 0))
+                                      for library in range(min(libraries, headers))],
+                    'shared-library-paths': [],
+                    'library-paths': [],
+                    'libraries': []
+                },
+                'targets': {
+                    'debug': {'arguments': ['-g'], 'debug': True},
+                    'release': {'arguments': ['-O2'], 'debug': False}
+                },
+                'files': files
+            }
+        },
+        'default_project': PROJECT_NAME
+    }
+    with open(os.path.join(directory, '.buildsfile'), 'w', encoding='utf-8') as file:
+        json.dump(configuration, file, indent=4)
+
+    usage = {}
+    for source in files:
+        with open(os.path.join(directory, source + '.deps'), mode='r', encoding='utf-8') as file:
+            for dependency in file.read().split()[2:]:
+                usage[dependency] = usage.get(dependency, 0) + 1
+    most_included = max(usage, key=lambda header: (usage[header], header)) if usage else None
+    return {
+        'directory': directory,
+        'files': files,
+        'extra-files': extra,
+        'most-included-header': most_included,
+        'most-included-count': usage.get(most_included, 0)
+    }
+
+
+@click.command()
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('sources', '--sources', default=200, help='Amount of source files')
+@click.option('headers', '--headers', default=100, help='Amount of header files')
+@click.option('fan_out', '--fan-out', default=8, help='Amount of headers every source includes')
+@click.option('libraries', '--libraries', default=4, help='Amount of library directories')
+@click.option('extra_files', '--extra-files', default=1000, help='Amount of sources generated outside of the project')
+@click.option('seed', '--seed', default=1, help='Random seed, the same seed generates the same project')
+def generate(directory, sources, headers, fan_out, libraries, extra_files, seed):
+    """Generate a synthetic C++ project into DIRECTORY."""
+    project = generate_project(directory, sources, headers, fan_out, libraries, extra_files, seed)
+    click.echo('Generated %d files in %s, %s is included by %d of them' % (
+        len(project['files']), directory, project['most-included-header'], project['most-included-count']
+    ))
+
+
+if __name__ == '__main__':
+    generate()
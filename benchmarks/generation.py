@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'builds'))
+
+from buildpipeline import BuildPipeline
+from commandpreprocessor import CommandPreprocessor
+from filelist import FileList
+from run import builds_revision
+
+
+def pipeline_configuration(directory):
+    return {
+        'jobs': 1,
+        'target': 'debug',
+        'libraries': [],
+        'library-paths': [],
+        'shared-library-paths': [],
+        'include-paths': ['./include'],
+        'arguments': ['-g'],
+        'steps': [],
+        'state-directory': directory
+    }
+
+
+def time_generation(count, directory):
+    """Returns the seconds taken to edit a file list and to generate the commands of a project of count files"""
+    files = [os.path.join('src%d' % (index % 100), 'file%d.cpp' % index) for index in range(count)]
+    start = time.monotonic()
+    file_list = FileList(files[:count // 2])
+    file_list.add_all(files)
+    file_list.remove_all(files[::2])
+    file_list.add_all(files[::2])
+    edit = time.monotonic() - start
+    pipeline = BuildPipeline('bench', 'CPP', CommandPreprocessor('bench'), pipeline_configuration(directory))
+    start = time.monotonic()
+    graph = pipeline.generate_graph(file_list.to_list())
+    generate = time.monotonic() - start
+    return {
+        'files': count,
+        'commands': len(graph.commands),
+        'file-list': round(edit, 4),
+        'generate': round(generate, 4),
+        'generate-per-file-us': round(generate / count * 1e6, 2)
+    }
+
+
+@click.command()
+@click.option('sizes', '--size', multiple=True, type=int, help='Project size in files, may be given several times')
+@click.option('output', '--output', default='', help='Write the results to a file instead of the stdout')
+def generation(sizes, output):
+    """Time editing the file list of and generating the build commands of projects of growing size, in process and
+    without running anything, to show that both grow linearly with the amount of files."""
+    sizes = sorted(sizes or (10000, 30000, 100000))
+    directory = tempfile.mkdtemp(prefix='builds-generation-')
+    try:
+        runs = [time_generation(size, directory) for size in sizes]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    results = {
+        'revision': builds_revision(),
+        'runs': runs,
+        'per-file-growth': round(runs[-1]['generate-per-file-us'] / runs[0]['generate-per-file-us'], 2)
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    else:
+        click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    generation()
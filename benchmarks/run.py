@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import click
+
+from generate import generate_project
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+BUILDS = os.path.join(os.path.dirname(BENCHMARKS_DIRECTORY), 'builds', 'builds.py')
+STUB_COMPILER = os.path.join(BENCHMARKS_DIRECTORY, 'stubcc.sh')
+ARGUMENTS_PER_CALL = 2000
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def builds_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIRECTORY,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    """Runs builds in a generated project with the stub compiler first on the PATH as g++"""
+
+    def __init__(self, directory, jobs):
+        self.directory = directory
+        self.jobs = jobs
+        bin_directory = os.path.join(directory, 'bin')
+        os.makedirs(bin_directory, exist_ok=True)
+        compiler = os.path.join(bin_directory, 'g++')
+        if not os.path.exists(compiler):
+            os.symlink(STUB_COMPILER, compiler)
+        self.environment = dict(os.environ)
+        self.environment['PATH'] = bin_directory + os.pathsep + self.environment.get('PATH', '')
+        self.environment.pop('BUILDS_WORKERS', None)
+
+    def builds(self, *arguments):
+        """Runs builds and returns its wall time"""
+        start = time.monotonic()
+        result = subprocess.run([sys.executable, BUILDS] + list(arguments), cwd=self.directory, env=self.environment,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        wall = time.monotonic() - start
+        if result.returncode != 0:
+            raise click.ClickException('builds %s failed:\n%s' % (' '.join(arguments), result.stderr.decode()))
+        return wall
+
+    def build(self):
+        return self.builds('build', '--no-cache', '--jobs', str(self.jobs))
+
+    def builds_in_chunks(self, command, files):
+        """Runs builds add or remove on files, split over calls that fit on a command line"""
+        return sum(self.builds(command, *files[index:index + ARGUMENTS_PER_CALL])
+                   for index in range(0, len(files), ARGUMENTS_PER_CALL))
+
+    def clean(self, files):
+        shutil.rmtree(os.path.join(self.directory, '.builds'), ignore_errors=True)
+        for path in [file + '.o' for file in files] + [file + '.o.d' for file in files]:
+            try:
+                os.remove(os.path.join(self.directory, path))
+            except FileNotFoundError:
+                pass
+
+    def touch(self, path):
+        """Changes the contents of a file, as the stub compiler objects depend on the contents of their inputs"""
+        with open(os.path.join(self.directory, path), 'a', encoding='utf-8') as file:
+            file.write('// %f\n' % time.time())
+
+
+def summarize(times):
+    return {
+        'runs': [round(wall, 4) for wall in times],
+        'min': round(min(times), 4),
+        'median': round(median(times), 4),
+        'max': round(max(times), 4)
+    }
+
+
+def compare(results, baseline):
+    """Returns the relative change of the median of every scenario against a previous result file"""
+    lines = []
+    for scenario, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous or not previous['median']:
+            continue
+        change = (result['median'] - previous['median']) / previous['median'] * 100.0
+        lines.append('%-14s %9.3fs -> %9.3fs %+7.1f%%' % (scenario, previous['median'], result['median'], change))
+    return '\n'.join(lines)
+
+
+@click.command()
+@click.option('sources', '--sources', default=200, help='Amount of source files')
+@click.option('headers', '--headers', default=100, help='Amount of header files')
+@click.option('fan_out', '--fan-out', default=8, help='Amount of headers every source includes')
+@click.option('libraries', '--libraries', default=4, help='Amount of library directories')
+@click.option('list_size', '--list-size', default=10000, help='Amount of files added and removed in one go')
+@click.option('jobs', '--jobs', default=4, help='Amount of parallel jobs of the builds')
+@click.option('repeat', '--repeat', default=3, help='Amount of times every scenario is run')
+@click.option('seed', '--seed', default=1, help='Random seed of the generated project')
+@click.option('directory', '--directory', default='', help='Generate the project here instead of a temporary directory')
+@click.option('output', '--output', default='', help='Write the results to a file instead of the stdout')
+@click.option('baseline', '--baseline', default='', help='Compare the results to an earlier result file')
+def run(sources, headers, fan_out, libraries, list_size, jobs, repeat, seed, directory, output, baseline):
+    """Time full, no-op and one header touched builds and add/remove of a long file list in a generated project."""
+    temporary = None
+    if not directory:
+        temporary = tempfile.mkdtemp(prefix='builds-benchmark-')
+        directory = temporary
+    try:
+        project = generate_project(directory, sources, headers, fan_out, libraries, list_size, seed)
+        benchmark = Benchmark(directory, jobs)
+        times = {'full': [], 'no-op': [], 'header-touch': [], 'add': [], 'remove': []}
+        for _ in range(repeat):
+            benchmark.clean(project['files'])
+            times['full'].append(benchmark.build())
+            times['no-op'].append(benchmark.build())
+            benchmark.touch(project['most-included-header'])
+            times['header-touch'].append(benchmark.build())
+            times['add'].append(benchmark.builds_in_chunks('add', project['extra-files']))
+            times['remove'].append(benchmark.builds_in_chunks('remove', project['extra-files']))
+        results = {
+            'revision': builds_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {
+                'sources': sources,
+                'headers': headers,
+                'fan-out': fan_out,
+                'libraries': libraries,
+                'list-size': list_size,
+                'jobs': jobs,
+                'repeat': repeat,
+                'seed': seed,
+                'header-touch-rebuilds': project['most-included-count']
+            },
+            'scenarios': {scenario: summarize(walls) for scenario, walls in times.items()}
+        }
+    finally:
+        if temporary:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    else:
+        click.echo(json.dumps(results, indent=2))
+    if baseline:
+        with open(baseline, mode='r', encoding='utf-8') as file:
+            click.echo(compare(results, json.load(file)), err=True)
+
+
+if __name__ == '__main__':
+    run()
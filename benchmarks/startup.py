@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import click
+
+from generate import generate_project
+from run import Benchmark, builds_revision, summarize
+
+
+@click.command()
+@click.option('sources', '--sources', default=200, help='Amount of source files')
+@click.option('headers', '--headers', default=100, help='Amount of header files')
+@click.option('repeat', '--repeat', default=20, help='Amount of times every command is run')
+@click.option('limit', '--limit', default=0.0,
+              help='Exit with status 1 when the median of a command takes more milliseconds than this')
+@click.option('output', '--output', default='', help='Write the results to a file instead of the stdout')
+def startup(sources, headers, repeat, limit, output):
+    """Time the startup of builds project show and of a no-op builds build in a generated project."""
+    directory = tempfile.mkdtemp(prefix='builds-startup-')
+    try:
+        generate_project(directory, sources, headers, extra_files=0)
+        benchmark = Benchmark(directory, 1)
+        benchmark.build()
+        times = {'python': [], 'project-show': [], 'no-op-build': []}
+        for _ in range(repeat):
+            start = time.monotonic()
+            subprocess.run([sys.executable, '-c', 'pass'], check=True)
+            times['python'].append(time.monotonic() - start)
+            times['project-show'].append(benchmark.builds('project', 'show'))
+            times['no-op-build'].append(benchmark.build())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        'revision': builds_revision(),
+        'parameters': {'sources': sources, 'headers': headers, 'repeat': repeat},
+        'scenarios': {scenario: summarize(walls) for scenario, walls in times.items()}
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    else:
+        click.echo(json.dumps(results, indent=2))
+    if limit:
+        slow = [scenario for scenario in ('project-show', 'no-op-build')
+                if results['scenarios'][scenario]['median'] * 1000 > limit]
+        for scenario in slow:
+            click.echo('%s took %.0fms, over the limit of %.0fms' % (
+                scenario, results['scenarios'][scenario]['median'] * 1000, limit), err=True)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    startup()
@@ -0,0 +1,37 @@
+#!/bin/sh
+# Stub compiler used by the benchmarks. Compiling writes a checksum of the source and its headers as the object
+# and copies the dependency file the generator prepared next to the source, linking writes a checksum of the
+# objects, so that the time spent in builds itself is what gets measured.
+out=""
+dep=""
+src=""
+preprocess=0
+inputs=""
+case "$1" in
+    @*) set -- $(cat "${1#@}") ;;
+esac
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -o) out="$2"; shift ;;
+        -MF) dep="$2"; shift ;;
+        -c) src="$2"; shift ;;
+        -E) preprocess=1 ;;
+        -*) ;;
+        *) inputs="$inputs $1" ;;
+    esac
+    shift
+done
+if [ -n "$src" ]; then
+    set -- $(cat "$src.deps")
+    shift
+    if [ -n "$dep" ]; then
+        cp "$src.deps" "$dep"
+    fi
+    if [ "$preprocess" = 1 ]; then
+        cat "$@"
+    else
+        cat "$@" | cksum > "$out"
+    fi
+else
+    cat $inputs | cksum > "$out"
+fi
@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+
+def system_load():
+    """Returns the number of currently runnable processes where the system reports it, the load average otherwise"""
+    try:
+        with open('/proc/loadavg', mode='r') as file:
+            running = file.read().split()[3].split('/')[0]
+        return max(0, int(running) - 1)
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def available_memory():
+    """Returns the memory available for new processes in bytes, or None when the system does not report it"""
+    try:
+        with open('/proc/meminfo', mode='r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class AdmissionControl:
+    """Decides when local commands may start. At most jobs commands run at a time, and fewer while the system load
+    is over max_load, while the expected peak memory of the running commands would exceed max_memory, or while a
+    command is expected to need more memory than is available. One command is always let through so that the
+    build makes progress. The conditions are checked again every poll_interval seconds, so concurrency ramps up
+    and down with the state of the machine."""
+
+    def __init__(self, jobs, max_load=None, max_memory=None, poll_interval=0.25):
+        self.jobs = max(1, jobs)
+        self.max_load = max_load
+        self.max_memory = max_memory
+        self.poll_interval = poll_interval
+        self.running = 0
+        self.reserved_memory = 0
+        self.peak_running = 0
+        self.throttled = 0
+        self.condition = asyncio.Condition()
+
+    def admissible(self, expected_memory):
+        if self.running == 0:
+            return True
+        if self.running >= self.jobs:
+            return False
+        if self.max_load:
+            load = system_load()
+            if load is not None and load >= self.max_load:
+                return False
+        if self.max_memory and self.reserved_memory + expected_memory > self.max_memory:
+            return False
+        if expected_memory:
+            available = available_memory()
+            if available is not None and expected_memory > available:
+                return False
+        return True
+
+    async def acquire(self, expected_memory=0):
+        async with self.condition:
+            held_back = False
+            while not self.admissible(expected_memory):
+                if self.running < self.jobs and not held_back:
+                    held_back = True
+                    self.throttled += 1
+                try:
+                    await asyncio.wait_for(self.condition.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.running += 1
+            self.reserved_memory += expected_memory
+            self.peak_running = max(self.peak_running, self.running)
+
+    async def release(self, expected_memory=0):
+        async with self.condition:
+            self.running -= 1
+            self.reserved_memory -= expected_memory
+            self.condition.notify_all()
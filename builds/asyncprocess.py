@@ -0,0 +1,86 @@
+import asyncio
+import os
+import signal
+import subprocess
+
+
+class LineProtocol(asyncio.Protocol):
+    """Calls on_line for every line read from a pipe"""
+
+    def __init__(self, on_line, done):
+        self.on_line = on_line
+        self.done = done
+        self.buffer = b''
+
+    def data_received(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        for line in lines:
+            self.on_line(line + b'\n')
+
+    def connection_lost(self, exc):
+        if self.buffer:
+            self.on_line(self.buffer)
+            self.buffer = b''
+        if not self.done.done():
+            self.done.set_result(None)
+
+
+def wait_process(process):
+    """Waits for a process to exit, returns its exit code and resource usage where the platform reports it"""
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        except InterruptedError:
+            continue
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, rusage
+
+
+def kill_process(process):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+
+async def run_process(command, on_line, loop, shell=True):
+    """Runs a command streaming its stdout and stderr lines to on_line(line, stream), returns the exit code and
+    resource usage. When cancelled the whole process group is killed."""
+    process = subprocess.Popen(
+        [command] if shell and isinstance(command, str) else command,
+        shell=shell,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True
+    )
+    waiting = loop.run_in_executor(None, wait_process, process)
+    transports = []
+    try:
+        streams = []
+        for pipe, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr')):
+            done = loop.create_future()
+            transport, protocol = await loop.connect_read_pipe(
+                lambda name=name, done=done: LineProtocol(lambda line: on_line(line, name), done),
+                pipe
+            )
+            transports.append(transport)
+            streams.append(done)
+        await asyncio.gather(*streams)
+        return await waiting
+    except asyncio.CancelledError:
+        kill_process(process)
+        raise
+    finally:
+        for transport in transports:
+            transport.close()
@@ -1,120 +1,193 @@
-import os
 import subprocess
 
+from commandpreprocessor import command_text
+from diagnostics import DiagnosticParser, LINE_CONTEXT, LINE_ERROR, LINE_LINK_ERROR, LINE_OTHER, LINE_WARNING
 from termcolor import colored
 
+RESPONSE_FILE_LIMIT = 32000
+MACHINE_TAGS = {LINE_ERROR: 'compile-error', LINE_WARNING: 'compile-warning', LINE_LINK_ERROR: 'link-error'}
+
 
 class BuildCommand:
-    def __init__(self, command, commandtype, displayName, infile, outfile):
+    def __init__(self, command, commandtype, displayName, infile, outfile, dependencies=None, depfile=None,
+                 preprocess_command=None, remote_command=None, response_files=False, implicit_inputs=None,
+                 incremental=False, linker=None, default_link=None):
         self.command = command
         self.commandtype = commandtype
         self.infile = infile
         self.outfile = outfile
         self.displayName = displayName
+        self.dependencies = dependencies
+        self.depfile = depfile
+        self.preprocess_command = preprocess_command
+        self.remote_command = remote_command
+        self.response_files = response_files
+        self.implicit_inputs = implicit_inputs
+        self.incremental = incremental
+        self.linker = linker
+        self.default_link = default_link
+        self.reset()
+
+    def reset(self):
+        """Forgets the outcome of the previous run, so that the command can be run again"""
+        self.preprocessed = None
+        self.update_command = None
+        self.console = None
+        self.diagnostics_writer = None
+        self.parser = None
+        self.diagnostics = []
+        self.output_lines = []
+        self.rusage = None
+        self.duration = None
+        self.result = None
         self.success = False
 
-    def process_message(self, message, pipeline_configuration):
-        tag_error = ' error:'
-        tag_warning = ' warning:'
-        tag_hint = 'required from here'
-        tag_linker = 'undefined reference to'
+    def command_line(self, command, suffix='.rsp'):
+        """Returns the command line to run. For tools reading response files, the arguments of command lines longer
+        than RESPONSE_FILE_LIMIT are written to a response file next to the output, as the system refuses to start
+        processes with too long command lines. Commands run by the shell are left as they are, as the shell has to
+        see their quotes, variables and redirections."""
+        if not self.response_files or isinstance(command, str) or len(command_text(command)) <= RESPONSE_FILE_LIMIT:
+            return command
+        path = self.outfile + suffix
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(command_text(command[1:]))
+        return [command[0], '@' + path]
+
+    def current_command(self):
+        """Returns the command to run, which for incremental commands may only pass the inputs that changed"""
+        return self.update_command or self.command
+
+    def execute(self, command, **options):
+        """Runs a command list directly, or a command string through the shell, returns the completed process"""
+        try:
+            return subprocess.run(command, shell=isinstance(command, str), **options)
+        except OSError as e:
+            return subprocess.CompletedProcess(command, 127, b'', str(e).encode('utf-8'))
+
+    def inputs(self):
+        """Returns the input file followed by its implicit inputs and its known dependencies, without duplicates"""
+        inputs = [self.infile] if self.infile else []
+        seen = set(inputs)
+        for dependency in (self.implicit_inputs or []) + (self.dependencies or []):
+            if dependency not in seen:
+                seen.add(dependency)
+                inputs.append(dependency)
+        return inputs
+
+    def add_diagnostic(self, diagnostic):
+        self.diagnostics.append(diagnostic)
+        if self.diagnostics_writer is not None:
+            self.diagnostics_writer.write(diagnostic)
+
+    def process_line(self, line, pipeline_configuration):
+        """Parses a line of tool output into diagnostics and returns the text to show for it, if any"""
+        for diagnostic in self.parser.feed(line):
+            self.add_diagnostic(diagnostic)
+        kind = self.parser.kind
+        if kind != LINE_OTHER:
+            self.output_lines.append(line)
         if pipeline_configuration.get('machine-readable', False):
-            lines = message.split("\n")
-            output = []
-            for line in lines:
-                out = False
-                for tag in [tag_error, tag_warning, tag_linker]:
-                    tag_pos = line.find(tag)
-                    if tag_pos == -1:
-                        continue
-                    message_pos = tag_pos + len(tag)
-                    while line[message_pos].isspace():
-                        message_pos = message_pos + 1
-                    faux_tag_pos = tag_pos
-                    while True:
-                        if faux_tag_pos < 0:
-                            break
-                        c = line[faux_tag_pos]
-                        if c == ':':
-                            tag_pos = faux_tag_pos
-                            break
-                        if c.isdigit():
-                            tag_pos = faux_tag_pos + 1
-                            break
-                        faux_tag_pos = faux_tag_pos - 1
-                    file_line = line[0:tag_pos]
-                    if tag == tag_error:
-                        out = "compile-error"
-                        if file_line == "collect2":
-                        	file_line = "*"
-                    if tag == tag_warning:
-                        out = "compile-warning"
-                    if tag == tag_linker:
-                        out = "link-error"
-                    out = out + " " + file_line + " " + line[message_pos:len(line)]
-                    break
-                if out != False:
-                    output.append(out)
-            message = "\n".join(output)
-        elif pipeline_configuration.get('verbose', False):
-            message = message.replace('error', colored('error', 'red'))
+            if kind not in MACHINE_TAGS:
+                return None
+            place = '*' if self.parser.location == 'collect2' else self.parser.location
+            return MACHINE_TAGS[kind] + ' ' + place + ' ' + self.parser.message
+        if pipeline_configuration.get('verbose', False):
+            return line.replace('error', colored('error', 'red'))
+        if kind in MACHINE_TAGS or (kind == LINE_CONTEXT and 'required from here' in line):
+            line = line.replace('error', colored('error', 'red'))
+            return line.replace('warning', colored('warning', 'yellow'))
+        return None
+
+    def start_output(self):
+        self.parser = DiagnosticParser(self.outfile)
+        self.diagnostics = []
+        self.output_lines = []
+
+    def end_output(self):
+        for diagnostic in self.parser.close():
+            self.add_diagnostic(diagnostic)
+
+    def replay(self, lines, pipeline_configuration, show=True):
+        """Feeds the logged diagnostic lines of the last run of an up-to-date command through the output processing,
+        showing them again when asked to"""
+        self.start_output()
+        for line in lines:
+            message = self.process_line(line, pipeline_configuration)
+            if message and show:
+                self.print_line(message)
+        self.end_output()
+
+    def print_line(self, text, status=False):
+        if self.console is None:
+            print(text)
+        elif status:
+            self.console.status(self, text)
         else:
-            lines = message.split("\n")
-            output = []
-            for line in lines:
-                tag_error_pos = line.find(tag_error)
-                if tag_error_pos == -1:
-                    tag_error_pos = line.find(tag_warning)
-                if tag_error_pos == -1:
-                    tag_error_pos = line.find(tag_linker)
-                if tag_error_pos == -1:
-                    tag_error_pos = line.find(tag_hint)
-                if tag_error_pos == -1:
-                    continue
-                output.append(line)
-            message = "\n".join(output)
-            message = message.replace('error', colored('error', 'red'))
-            message = message.replace('warning', colored('warning', 'yellow'))
-        return message
-
-    def run(self, pipeline_configuration):
-        verbose = pipeline_configuration.get('verbose', False)
-        rebuild = pipeline_configuration.get('rebuild', False)
-        machine_readable = pipeline_configuration.get('machine-readable', False)
-
-        if self.infile != self.outfile and not rebuild and os.path.isfile(self.infile) and os.path.isfile(self.outfile):
-            in_mtime = os.path.getmtime(self.infile)
-            out_mtime = os.path.getmtime(self.outfile)
-            if out_mtime > in_mtime:
-                self.success = True
-                return True
-
-        if machine_readable:
-            print(self.commandtype + ' ' + self.displayName)
+            self.console.write(self, text)
+
+    def print_status(self, pipeline_configuration, status):
+        if pipeline_configuration.get('machine-readable', False):
+            self.print_line(status + ' ' + self.displayName, True)
+        else:
+            self.print_line(colored(status, 'green') + ' ' + self.displayName, True)
+
+    def print_failure(self, pipeline_configuration):
+        if pipeline_configuration.get('machine-readable', False):
+            self.print_line(self.commandtype + '-failed')
         else:
-            print(colored(self.commandtype, 'green') + ' ' + self.displayName)
+            self.print_line(colored(self.commandtype + ' failed', 'red'))
+
+    def preprocess(self):
+        """Returns the preprocessed source of a compile command, or None if preprocessing failed"""
+        if self.preprocessed is None and self.preprocess_command:
+            result = self.execute(
+                self.command_line(self.preprocess_command, '.i.rsp'),
+                stderr=subprocess.DEVNULL,
+                stdout=subprocess.PIPE
+            )
+            if result.returncode == 0:
+                self.preprocessed = result.stdout
+        return self.preprocessed
 
+    async def run_async(self, pipeline_configuration, loop):
+        """Runs the command streaming its output as it arrives"""
+        from asyncprocess import run_process
+        self.print_status(pipeline_configuration, self.commandtype)
+
+        if pipeline_configuration.get('verbose', False):
+            self.print_line(command_text(self.current_command()))
+
+        def on_line(line, stream):
+            message = self.process_line(line.decode('utf-8', 'replace').rstrip('\n'), pipeline_configuration)
+            if message:
+                self.print_line(message)
+
+        command = self.command_line(self.current_command())
+        self.start_output()
         try:
-            if verbose:
-                print(self.command)
-
-            message = subprocess.run(
-                [self.command],
-                shell=True,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                check=True
-            ).stdout.decode("utf-8")
-
-            self.success = True
-
-        except subprocess.CalledProcessError as e:
-            if machine_readable:
-                print(self.commandtype + '-failed')
-            else:
-                print(colored(self.commandtype + ' failed', 'red'))
-            message = e.stderr.decode("utf-8")
-        if message:
-            message = self.process_message(message, pipeline_configuration)
-            print(message)
+            returncode, self.rusage = await run_process(command, on_line, loop, shell=isinstance(command, str))
+        except OSError as e:
+            self.print_line(str(e))
+            returncode = 127
+        self.end_output()
+        self.preprocessed = None
+        self.success = returncode == 0
+        if not self.success:
+            self.print_failure(pipeline_configuration)
+        return self.success
+
+    def finish(self, pipeline_configuration, returncode, stdout, stderr):
+        """Reports the result of a command executed elsewhere, such as on a remote worker"""
+        self.preprocessed = None
+        self.success = returncode == 0
+        if not self.success:
+            self.print_failure(pipeline_configuration)
+        self.start_output()
+        for output in (stdout, stderr):
+            for line in output.decode('utf-8', 'replace').splitlines():
+                message = self.process_line(line, pipeline_configuration)
+                if message:
+                    self.print_line(message)
+        self.end_output()
         return self.success
@@ -0,0 +1,157 @@
+import heapq
+
+
+class BuildGraphError(Exception):
+    pass
+
+
+class BuildGraph:
+    """Dependency graph of build commands generated from the input and output declarations of the pipeline steps.
+    A command depends on the commands of the producing step that write one of its inputs, so that a command made
+    from a single input file starts as soon as that file is ready. Commands combining the whole input of their step,
+    such as a link, depend on the whole producing step when none of their inputs are known outputs of it, and so
+    does every command on the steps making the outputs its step "requires" besides its input."""
+
+    def __init__(self):
+        self.commands = []
+        self.dependencies = {}
+        self.dependents = {}
+        self.steps = []
+        self.priorities = {}
+
+    def add_step(self, step, commands, producer_commands, required_commands=()):
+        producer_groups = []
+        for group, whole in ((producer_commands, False), (required_commands, True)):
+            if group:
+                producer_groups.append(({producer.outfile: producer for producer in group}, group, whole))
+        for command in commands:
+            needed = []
+            for outputs, group, whole in producer_groups:
+                found = []
+                for path in command.inputs():
+                    producer = outputs.get(path)
+                    if producer is not None and producer is not command:
+                        found.append(producer)
+                if not found and (whole or command.infile is None):
+                    found = group
+                needed.extend(found)
+            self.commands.append(command)
+            self.dependencies[command] = needed
+            self.dependents.setdefault(command, [])
+            for producer in needed:
+                self.dependents.setdefault(producer, []).append(command)
+        self.steps.append((step, commands))
+
+    def critical_paths(self, durations):
+        """Returns for every command the expected time from its start to the end of the longest chain of commands
+        depending on it"""
+        paths = {}
+        for command in reversed(self.commands):
+            longest = 0
+            for dependent in self.dependents[command]:
+                longest = max(longest, paths[dependent])
+            paths[command] = durations[command] + longest
+        return paths
+
+    def prioritize(self, durations, urgent=()):
+        """Orders ready commands urgent first, then by the longest critical path"""
+        paths = self.critical_paths(durations)
+        self.priorities = {command: (command not in urgent, -paths[command]) for command in self.commands}
+
+    def ready_key(self, command, index):
+        return self.priorities.get(command, (True, 0)), index
+
+    def estimate_makespan(self, durations, jobs):
+        """Simulates running the graph with jobs commands at a time in priority order, returns the total time"""
+        index = {command: position for position, command in enumerate(self.commands)}
+        waiting = {command: len(self.dependencies[command]) for command in self.commands}
+        ready = [(self.ready_key(command, index[command]), command) for command in self.commands
+                 if waiting[command] == 0]
+        heapq.heapify(ready)
+        running = []
+        now = 0.0
+        while ready or running:
+            while ready and len(running) < max(1, jobs):
+                key, command = heapq.heappop(ready)
+                heapq.heappush(running, (now + durations[command], index[command], command))
+            now, position, command = heapq.heappop(running)
+            for dependent in self.dependents[command]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    heapq.heappush(ready, (self.ready_key(dependent, index[dependent]), dependent))
+        return now
+
+    async def run(self, run_command, jobs, keep_going=0, fail_fast=False):
+        """Runs every command once all of its dependencies succeeded, with up to jobs commands at a time.
+        run_command(command) is a coroutine returning the success of the command. No new commands are started
+        after keep_going failures (0 for no limit), and with fail_fast the running commands are cancelled on the
+        first failure. Returns the commands that failed or did not run."""
+        import asyncio
+        jobs = max(1, jobs)
+        index = {command: position for position, command in enumerate(self.commands)}
+        waiting = {command: len(self.dependencies[command]) for command in self.commands}
+        ready = [(self.ready_key(command, index[command]), command) for command in self.commands
+                 if waiting[command] == 0]
+        heapq.heapify(ready)
+        running = {}
+        succeeded = set()
+        failures = 0
+        stopping = False
+        try:
+            while running or (ready and not stopping):
+                while ready and not stopping and len(running) < jobs:
+                    key, command = heapq.heappop(ready)
+                    running[asyncio.ensure_future(run_command(command))] = command
+                done, pending = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    command = running.pop(task)
+                    if task.cancelled():
+                        continue
+                    if task.result():
+                        succeeded.add(command)
+                        for dependent in self.dependents[command]:
+                            waiting[dependent] -= 1
+                            if waiting[dependent] == 0:
+                                heapq.heappush(ready, (self.ready_key(dependent, index[dependent]), dependent))
+                        continue
+                    failures += 1
+                    if fail_fast or (keep_going and failures >= keep_going):
+                        stopping = True
+                    if fail_fast:
+                        for other in running:
+                            other.cancel()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(list(running))
+        return [command for command in self.commands if command not in succeeded]
+
+
+def order_steps(steps):
+    """Orders the pipeline steps so that every step comes after all the steps producing its input or the outputs it
+    requires"""
+    producers = {}
+    for step in steps:
+        producers.setdefault(step.get('output'), []).append(step)
+    ordered = []
+    done = set()
+    visiting = set()
+
+    def visit(step):
+        if id(step) in done:
+            return
+        if id(step) in visiting:
+            raise BuildGraphError('Pipeline steps form a cycle at step ' + str(step.get('type')))
+        visiting.add(id(step))
+        for output in [step.get('input')] + step.get('requires', []):
+            for producer in producers.get(output, []):
+                if producer is not step:
+                    visit(producer)
+        visiting.discard(id(step))
+        done.add(id(step))
+        ordered.append(step)
+
+    for step in steps:
+        visit(step)
+    return ordered
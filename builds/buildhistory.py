@@ -0,0 +1,90 @@
+import json
+import os
+
+DURATION_WEIGHT = 0.5
+MEMORY_DECAY = 0.9
+
+
+class BuildHistory:
+    """Per project target record of how the commands behaved in previous builds, keyed on the command output.
+    Durations are kept as a moving average so that a single slow run does not dominate the estimates."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.typical_values = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                self.records = json.load(file)
+        except ValueError:
+            self.records = {}
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self.records, file, separators=(',', ':'))
+        self.changed = False
+
+    def get(self, command):
+        return self.records.get(command.outfile, {})
+
+    def update(self, command, **values):
+        self.update_output(command.outfile, **values)
+
+    def update_output(self, outfile, **values):
+        record = self.records.setdefault(outfile, {})
+        memory = values.pop('memory', None)
+        if memory is not None:
+            # Peak memory decays slowly so that a single heavy run is remembered for a while
+            record['memory'] = int(max(memory, MEMORY_DECAY * record.get('memory', 0)))
+        duration = values.pop('duration', None)
+        if duration is not None:
+            previous = record.get('duration')
+            if previous is not None:
+                duration = DURATION_WEIGHT * duration + (1 - DURATION_WEIGHT) * previous
+            record['duration'] = round(duration, 4)
+        record.update(values)
+        self.changed = True
+
+    def update_link(self, command, duration, linker=None):
+        """Keeps the latest time of a link with every linker it was linked with, so that linkers can be compared"""
+        record = self.records.setdefault(command.outfile, {})
+        record.setdefault('linkers', {})[linker or command.linker or 'default'] = round(duration, 4)
+        self.changed = True
+
+    def failed(self, command):
+        return self.get(command).get('failed', False)
+
+    def expected(self, command, key, default):
+        """Returns the recorded value of a command, guessing from commands of the same type when unknown"""
+        return self.expected_output(command.outfile, command.commandtype, key, default)
+
+    def expected_output(self, outfile, commandtype, key, default):
+        value = self.records.get(outfile, {}).get(key)
+        if value is not None:
+            return value
+        return self.typical(commandtype, key, default)
+
+    def expected_duration(self, command):
+        return self.expected(command, 'duration', 1.0)
+
+    def expected_memory(self, command):
+        return self.expected(command, 'memory', 0)
+
+    def typical(self, commandtype, key, default):
+        if (commandtype, key) not in self.typical_values:
+            # Unity sources compile several files at once, their members have a share of the time recorded instead
+            values = [record[key] for record in self.records.values()
+                      if record.get('type') == commandtype and key in record and not record.get('unity')]
+            self.typical_values[(commandtype, key)] = sum(values) / len(values) if values else default
+        return self.typical_values[(commandtype, key)]
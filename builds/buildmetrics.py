@@ -0,0 +1,82 @@
+import json
+import os
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class MetricsStore:
+    """Append only store of one compact json record per build, used to follow build times over time"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, record):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, separators=(',', ':'), sort_keys=True) + '\n')
+
+    def read(self, project=None, target=None):
+        records = []
+        if not os.path.isfile(self.path):
+            return records
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if project is not None and record.get('project') != project:
+                    continue
+                if target is not None and record.get('target') != target:
+                    continue
+                records.append(record)
+        return records
+
+
+def build_record(pipeline, project, target, jobs, wall):
+    """Returns the metrics record of a finished build"""
+    counts = {'executed': 0, 'up-to-date': 0, 'cut-off': 0, 'cached': 0, 'failed': 0}
+    durations = {}
+    for command in pipeline.graph.commands:
+        if command.result in counts:
+            counts[command.result] += 1
+        if command.result == 'executed' and command.duration is not None:
+            durations[command.outfile] = round(command.duration, 4)
+    return {
+        'time': int(pipeline.started),
+        'project': project,
+        'target': target,
+        'jobs': jobs,
+        'wall': round(wall, 4),
+        'success': not pipeline.run_command_errors,
+        'counts': counts,
+        'durations': durations
+    }
+
+
+def detect_regressions(records, window, threshold, min_duration):
+    """Compares the command durations of the latest build to the median of the previous window builds that ran the
+    same command. Returns (output, latest, baseline) for every command slower than the baseline by more than
+    threshold percent and min_duration seconds, largest slowdown first."""
+    if not records:
+        return []
+    latest = records[-1]
+    regressions = []
+    for output, duration in latest.get('durations', {}).items():
+        history = [record['durations'][output] for record in records[:-1] if output in record.get('durations', {})]
+        history = history[-window:]
+        if not history:
+            continue
+        baseline = median(history)
+        if duration > baseline * (1 + threshold / 100.0) and duration - baseline > min_duration:
+            regressions.append((output, duration, baseline))
+    regressions.sort(key=lambda regression: regression[1] - regression[2], reverse=True)
+    return regressions
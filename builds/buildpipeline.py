@@ -1,14 +1,24 @@
 import sys
 import os
+import time
 import importer
 
-from multiprocessing.dummy import Pool as ThreadPool
+from contextlib import contextmanager
+from termcolor import colored
+from buildgraph import BuildGraph, BuildGraphError, order_steps
+from buildhistory import BuildHistory
+from buildprofile import peak_memory
+from buildstate import BuildState
+from commandstep import CommandStep
+from compilecache import CompileCache, parse_size
+from dependencyindex import DependencyIndex
+from diagnosticslog import DiagnosticsLog
 
 
 class BuildPipeline:
     """This will determine the pipeline required for the project and will call correct methods"""
 
-    def __init__(self, projectname, pipeline, command_processor, pipeline_configuration):
+    def __init__(self, projectname, pipeline, command_processor, pipeline_configuration, tracer=None):
 
         stepobj = importer.import_pipeline(pipeline)
         if stepobj:
@@ -17,8 +27,13 @@ class BuildPipeline:
             print('No pipeline ' + pipeline + ' found for project ' + projectname + '.')
             sys.exit(os.EX_CONFIG)
 
+        self.custom_step = CommandStep(command_processor)
         self.projectname = projectname
-        self.settings = self.step.get_default_pipeline()
+        self.tracer = tracer
+        self.settings = self.step.get_default_pipeline(
+            pipeline_configuration.get('precompiled-header'),
+            pipeline_configuration.get('archives', False)
+        ) + pipeline_configuration.get('steps', [])
         self.run_command_errors = False
         self.pipeline_configuration = pipeline_configuration
         self.libraries = pipeline_configuration['libraries']
@@ -26,37 +41,420 @@ class BuildPipeline:
         self.shared_library_paths = pipeline_configuration['shared-library-paths']
         self.include_paths = pipeline_configuration['include-paths']
         self.arguments = pipeline_configuration['arguments']
-    
+        self.state_directory = pipeline_configuration.get('state-directory', '.builds')
+        self.dependency_index = DependencyIndex(os.path.join(self.state_directory, projectname + '.deps.json'))
+        target_path = os.path.join(
+            self.state_directory,
+            projectname + '.' + pipeline_configuration.get('target', 'debug')
+        )
+        self.target_directory = target_path
+        self.build_state = BuildState(target_path + '.state.json')
+        self.history = BuildHistory(target_path + '.history.json')
+        self.unity = None
+        if pipeline_configuration.get('unity'):
+            from unitybuild import UnityBuild
+            self.unity = UnityBuild(target_path + '.unity.json', target_path + '.unity',
+                                    pipeline_configuration['unity'], self.history)
+        self.diagnostics_log = DiagnosticsLog(target_path + '.diagnostics.json')
+        self.show_replayed = True
+        self.up_to_date = set()
+        self.reasons = {}
+        self.estimated_makespan = 0.0
+        self.makespan = 0.0
+        self.executed_commands = 0
+        self.cutoff_commands = 0
+        self.uncached_compiles = 0
+        self.graph = None
+        self.graph_files = None
+        self.started = None
+        self.loop = None
+        self.console = None
+        self.diagnostics_writer = None
+        self.admission = None
+        self.compile_cache = None
+        if pipeline_configuration.get('cache-directory'):
+            self.compile_cache = CompileCache(
+                pipeline_configuration['cache-directory'],
+                parse_size(pipeline_configuration.get('cache-size', '5G'))
+            )
+        self.remote_compiler = None
+        self.remote_slots = 0
+        self.durations = {}
+
+    def connect_workers(self):
+        """Connects to the remote workers the first time commands run, so that builds with nothing to run and dry
+        runs do not reach out to other machines"""
+        if self.remote_compiler is not None or not self.pipeline_configuration.get('workers'):
+            return False
+        from remotecompiler import RemoteCompiler
+        self.remote_compiler = RemoteCompiler(
+            self.pipeline_configuration['workers'],
+            self.pipeline_configuration.get('worker-token')
+        )
+        self.remote_slots = self.remote_compiler.connect()
+        return True
+
     def generate_step(self, step, settings, files):
-        func = getattr(self.step, step)
+        func = getattr(self.step, step, None)
+        settings = dict(settings)
+        if func is None:
+            func = getattr(self.custom_step, step, None)
+        elif settings.get('target-arguments', True):
+            settings['arguments'] = settings.get('arguments', []) + self.arguments
+        if func is None:
+            print('No step ' + step + ' found for project ' + self.projectname + '.')
+            sys.exit(os.EX_CONFIG)
         settings['libraries'] = self.libraries
         settings['library-paths'] = self.library_paths
         settings['shared-library-paths'] = self.shared_library_paths
         settings['include-paths'] = self.include_paths
-        settings['arguments'] += self.arguments
+        settings['dependency-index'] = self.dependency_index
+        settings['target-directory'] = self.target_directory
+        settings['unity'] = self.unity
+        settings['fast-link'] = self.pipeline_configuration.get('fast-link', False)
+        settings['debug'] = self.pipeline_configuration.get('debug', False)
+        settings['split-dwarf'] = self.pipeline_configuration.get('split-dwarf', False)
+        settings['dry-run'] = self.pipeline_configuration.get('dry-run', False)
+        if 'shell' not in settings:
+            settings['shell'] = self.pipeline_configuration.get('shell', False)
         return func(self.projectname, settings, files)
 
-    def run_command(self, command):
-        if not command.run(self.pipeline_configuration):
+    def generate_graph(self, files):
+        """Generates the commands of every step in dependency order, feeding each step the files declared as its
+        input. The project files are the "files" input, which generating steps may add to."""
+        try:
+            build_steps = order_steps(self.settings)
+        except BuildGraphError as e:
+            print(str(e))
+            sys.exit(os.EX_CONFIG)
+        graph = BuildGraph()
+        step_inputs = {'files': list(files)}
+        producers = {}
+        for step in build_steps:
+            step_input = step.get('input', 'files')
+            step_files = step_inputs.get(step_input, step.get('files', []))
+            (step_commands, step_outputs) = self.generate_step(step.get('type'), step, step_files)
+            required = [command for output in step.get('requires', []) for command in producers.get(output, [])]
+            graph.add_step(step, step_commands, producers.get(step_input, []), required)
+            step_inputs.setdefault(step.get('output'), []).extend(step_outputs)
+            producers.setdefault(step.get('output'), []).extend(step_commands)
+        if self.unity is not None:
+            self.invalidate(self.unity.written)
+        return graph
+
+    async def execute_command(self, command):
+        start = time.monotonic()
+        try:
+            return await self.execute_command_on_slot(command)
+        finally:
+            command.duration = time.monotonic() - start
+
+    async def execute_command_on_slot(self, command):
+        if self.remote_compiler and command.remote_command and command.preprocess_command:
+            worker = self.remote_compiler.acquire()
+            if worker is not None:
+                try:
+                    success = await self.loop.run_in_executor(
+                        None, self.remote_compiler.compile, worker, command, self.pipeline_configuration
+                    )
+                finally:
+                    self.remote_compiler.release(worker)
+                if success is not None:
+                    return success
+        expected_memory = self.history.expected_memory(command)
+        await self.admission.acquire(expected_memory)
+        try:
+            return await command.run_async(self.pipeline_configuration, self.loop)
+        finally:
+            await self.admission.release(expected_memory)
+
+    async def run_command(self, command):
+        if self.tracer is None:
+            return await self.build_command(command)
+        slot = self.tracer.acquire_slot()
+        start = time.monotonic()
+        try:
+            return await self.build_command(command)
+        finally:
+            self.tracer.release_slot(slot)
+            self.tracer.complete(command.displayName, command.commandtype, start, time.monotonic(), slot,
+                                 {'output': command.outfile, 'result': command.result})
+
+    async def build_command(self, command):
+        import asyncio
+        try:
+            if command in self.up_to_date or (
+                    not self.pipeline_configuration.get('rebuild', False) and self.build_state.is_up_to_date(command)):
+                command.success = True
+                command.result = 'up-to-date'
+                if command not in self.up_to_date:
+                    # Planned to run after a dependency that ran, but the dependency rewrote its output byte for byte
+                    command.result = 'cut-off'
+                    self.cutoff_commands += 1
+                    if self.pipeline_configuration.get('explain'):
+                        command.print_line(colored('skip', 'green') + ' ' + command.displayName +
+                                           ': rebuilt inputs did not change', True)
+                    self.replay_diagnostics(command)
+                    self.console.finish(command)
+                return True
+            if command.incremental:
+                self.prepare_incremental(command)
+            if self.compile_cache and command.preprocess_command:
+                success = await self.compile_cache.run(
+                    command, self.pipeline_configuration, self.execute_command, self.loop
+                )
+            else:
+                if command.commandtype == 'compile' and command.preprocess_command is None and (
+                        self.compile_cache or self.remote_compiler):
+                    # Compiles without a preprocess command, such as split DWARF compiles, can not use either
+                    self.uncached_compiles += 1
+                success = await self.execute_command(command)
+        except asyncio.CancelledError:
+            command.result = 'cancelled'
+            self.console.finish(command, True)
+            raise
+        self.console.finish(command)
+        command.result = 'cached' if command.duration is None else 'executed'
+        if not success:
+            command.result = 'failed'
+        if command.output_lines is not None:
+            # Cache hits have the lines stored with the object, unless it was stored without them
+            self.diagnostics_log.record(command)
+        if command.duration is not None:
+            self.executed_commands += 1
+            self.history.update(command, type=command.commandtype, duration=command.duration, failed=not success)
+            if success and command.commandtype == 'build':
+                self.history.update_link(command, command.duration)
+                if command.default_link is not None and 'default' not in self.history.get(command)['linkers']:
+                    await self.time_default_link(command)
+            if success and self.unity is not None and command.commandtype == 'compile':
+                self.unity.record(command)
+        if command.rusage is not None:
+            self.history.update(command, memory=peak_memory(command.rusage))
+        if not success:
             self.run_command_errors = True
-        return self.run_command_errors
+            if self.unity is not None and command.commandtype == 'compile':
+                for isolated in self.unity.isolate_failed(command):
+                    command.print_line('Isolated ' + isolated + ' from ' + command.displayName, True)
+            return False
+        if command.depfile:
+            command.dependencies = self.dependency_index.update(command.outfile, command.depfile)
+        self.build_state.record(command)
+        return True
+
+    async def time_default_link(self, command):
+        """Links once more with the default linker into a scratch file, the first time a fast linker is used, so that
+        the link time can be compared to the one before fast linking"""
+        default_link = command.default_link
+        default_link.reset()
+        default_link.console = command.console
+        success = await self.execute_command(default_link)
+        try:
+            os.remove(default_link.outfile)
+        except OSError:
+            pass
+        if success:
+            self.history.update_link(command, default_link.duration, 'default')
+
+    def prepare_incremental(self, command):
+        """Lets a command updating its output in place, such as an archive, pass only the inputs that changed.
+        Its output is removed first when it has to be made from scratch, so that nothing stale is left in it."""
+        changed = None
+        if not self.pipeline_configuration.get('rebuild', False) and not isinstance(command.command, str):
+            changed = self.build_state.changed_inputs(command)
+        if changed is None:
+            command.update_command = None
+            try:
+                os.remove(command.outfile)
+            except OSError:
+                pass
+            return
+        unchanged = set(command.inputs()).difference(changed)
+        command.update_command = [argument for argument in command.command if argument not in unchanged]
 
-    def run_commands(self, build_commands):
-        pool = ThreadPool(self.pipeline_configuration.get('jobs', 1))
-        pool.map(self.run_command, build_commands)
-        pool.close()
-        pool.join()
-        return not self.run_command_errors
+    @contextmanager
+    def trace(self, name):
+        if self.tracer is None:
+            yield
+        else:
+            with self.tracer.span(name):
+                yield
+
+    def stat_commands(self, build_commands):
+        paths = []
+        for command in build_commands:
+            paths.append(command.outfile)
+            paths.extend(command.inputs())
+        self.build_state.stat_all(paths)
+
+    def plan(self, graph):
+        """Predicts which commands will run and how long they take from the build history, orders the graph so that
+        the longest chains of work start first and commands that failed last time or were just edited come before
+        everything else, and returns the estimated makespan"""
+        rebuild = self.pipeline_configuration.get('rebuild', False)
+        will_run = set()
+        urgent = set()
+        durations = {}
+        self.reasons = {}
+        for command in graph.commands:
+            reason = 'forced rebuild' if rebuild else self.build_state.explain(command)
+            if reason is None:
+                running = [dependency for dependency in graph.dependencies[command] if dependency in will_run]
+                reason = 'depends on ' + running[0].displayName + ', which runs' if running else None
+            if reason is not None:
+                self.reasons[command] = reason
+                will_run.add(command)
+                durations[command] = self.history.expected_duration(command)
+                if self.history.failed(command) or self.build_state.inputs_changed(command):
+                    urgent.add(command)
+            else:
+                self.up_to_date.add(command)
+                durations[command] = 0.0
+        graph.prioritize(durations, urgent)
+        self.durations = durations
+        return graph.estimate_makespan(durations, self.pipeline_configuration.get('jobs', 1) + self.remote_slots)
+
+    def replay_diagnostics(self, command):
+        """Replays the logged diagnostics of an up-to-date command, so that its warnings are not lost because it did
+        not have to run"""
+        lines = self.diagnostics_log.lines(command)
+        if lines:
+            command.replay(lines, self.pipeline_configuration, self.show_replayed)
+
+    def explain(self, graph, verbose=False):
+        """Prints why each command of the graph runs, and with verbose which commands are up to date"""
+        for command in graph.commands:
+            reason = self.reasons.get(command)
+            if reason is not None:
+                print(colored('run', 'yellow') + ' ' + command.displayName + ': ' + reason)
+            elif verbose:
+                print(colored('skip', 'green') + ' ' + command.displayName + ': up to date')
+        print(str(len(self.reasons)) + ' of ' + str(len(graph.commands)) + ' commands ' +
+              ('would run' if self.pipeline_configuration.get('dry-run') else 'run'))
+
+    def run_graph(self, graph):
+        """Runs the commands of the graph on an event loop, returns the commands that failed or did not run"""
+        # Imported here as a build with nothing to run does not need the event loop
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from admission import AdmissionControl
+        from console import ConsoleOutput
+
+        jobs = self.pipeline_configuration.get('jobs', 1)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * (jobs + self.remote_slots) + 4))
+        self.admission = AdmissionControl(
+            jobs,
+            self.pipeline_configuration.get('max-load'),
+            self.pipeline_configuration.get('max-memory')
+        )
+        self.console = ConsoleOutput()
+        for command in graph.commands:
+            command.console = self.console
+            command.diagnostics_writer = self.diagnostics_writer
+        task = self.loop.create_task(graph.run(
+            self.run_command,
+            jobs + self.remote_slots,
+            self.pipeline_configuration.get('keep-going', 0),
+            self.pipeline_configuration.get('fail-fast', False)
+        ))
+        try:
+            return self.loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            self.loop.run_until_complete(asyncio.wait([task]))
+            raise
+        finally:
+            self.loop.close()
+            asyncio.set_event_loop(None)
+
+    def invalidate(self, paths):
+        """Forgets what is known about paths that changed since the previous run of this pipeline"""
+        for path in paths:
+            self.build_state.forget(path)
 
     def run(self, files):
-        build_steps = self.settings
+        """Builds the files. The graph of a previous run is reused when the files are the same, so a long lived
+        pipeline only has to look at the paths invalidated since then."""
+        self.started = time.time()
+        self.run_command_errors = False
+        self.up_to_date = set()
+        self.executed_commands = 0
+        self.cutoff_commands = 0
+        self.uncached_compiles = 0
+        if self.graph is not None and self.graph_files == list(files):
+            graph = self.graph
+            for command in graph.commands:
+                command.reset()
+        else:
+            with self.trace('generate commands'):
+                graph = self.generate_graph(files)
+            self.graph = graph
+            self.graph_files = list(files)
+        with self.trace('schedule'):
+            self.stat_commands(graph.commands)
+            self.estimated_makespan = self.plan(graph)
+        if self.pipeline_configuration.get('explain') or self.pipeline_configuration.get('dry-run'):
+            self.explain(graph, self.pipeline_configuration.get('verbose', False))
+        if self.pipeline_configuration.get('dry-run'):
+            return 0
+        self.diagnostics_log.retain(set(command.outfile for command in graph.commands))
+        if self.pipeline_configuration.get('diagnostics'):
+            from diagnostics import DiagnosticsWriter
+            self.diagnostics_writer = DiagnosticsWriter(
+                self.pipeline_configuration['diagnostics'],
+                self.pipeline_configuration.get('diagnostics-format', 'jsonl')
+            )
+        start = time.monotonic()
+        try:
+            for command in graph.commands:
+                if command in self.up_to_date:
+                    command.diagnostics_writer = self.diagnostics_writer
+                    self.replay_diagnostics(command)
+            if len(self.up_to_date) == len(graph.commands):
+                # Nothing runs, the trace still gets an event for every command as run_command would record it
+                slot = self.tracer.acquire_slot() if self.tracer is not None else None
+                for command in graph.commands:
+                    command.success = True
+                    command.result = 'up-to-date'
+                    if self.tracer is not None:
+                        moment = time.monotonic()
+                        self.tracer.complete(command.displayName, command.commandtype, moment, moment, slot,
+                                             {'output': command.outfile, 'result': command.result})
+                if slot is not None:
+                    self.tracer.release_slot(slot)
+                not_run = set()
+            else:
+                if self.connect_workers():
+                    self.estimated_makespan = graph.estimate_makespan(
+                        self.durations, self.pipeline_configuration.get('jobs', 1) + self.remote_slots
+                    )
+                with self.trace('run commands'):
+                    not_run = set(self.run_graph(graph))
+        finally:
+            self.makespan = time.monotonic() - start
+            if self.diagnostics_writer:
+                self.diagnostics_writer.close()
+                self.diagnostics_writer = None
+            with self.trace('save state'):
+                self.dependency_index.save()
+                self.build_state.save()
+                self.history.save()
+                self.diagnostics_log.save()
+                if self.unity is not None:
+                    self.unity.save()
+                if self.compile_cache:
+                    self.compile_cache.evict()
+        # Pipelines kept alive between builds show the warnings of unchanged files only once
+        self.show_replayed = False
+        if self.unity is not None and self.unity.isolated_now:
+            print('Building again with the failed files of unity sources compiled on their own')
+            self.unity.isolated_now = []
+            self.graph = None
+            return self.run(files)
         stepsFinished = 0
-        for step in build_steps:
-            steptype = step.get('type')
-            (step_commands, step_files) = self.generate_step(steptype, step, files)
-            success = self.run_commands(step_commands)
-            if success:
+        for step, step_commands in graph.steps:
+            if not any(command in not_run for command in step_commands):
                 stepsFinished += 1
-                continue
-            break
         return stepsFinished
@@ -0,0 +1,49 @@
+import json
+import sys
+
+
+def peak_memory(rusage):
+    """Returns the peak resident set size of a finished process in bytes"""
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+def profile_rows(commands):
+    """Returns the resource usage of every command that ran as a local process, heaviest CPU users first"""
+    rows = []
+    for command in commands:
+        if command.rusage is None:
+            continue
+        rows.append({
+            'name': command.displayName,
+            'type': command.commandtype,
+            'output': command.outfile,
+            'wall': round(command.duration or 0.0, 4),
+            'user': round(command.rusage.ru_utime, 4),
+            'system': round(command.rusage.ru_stime, 4),
+            'memory': peak_memory(command.rusage)
+        })
+    rows.sort(key=lambda row: row['user'] + row['system'], reverse=True)
+    return rows
+
+
+def format_profile(rows, top):
+    """Formats the top heaviest compiles and every link as a table"""
+    compiles = [row for row in rows if row['type'] == 'compile'][:top]
+    others = [row for row in rows if row['type'] != 'compile']
+    lines = ['%-40s %-8s %9s %9s %9s %10s' % ('command', 'type', 'wall s', 'user s', 'sys s', 'peak MB')]
+    for row in compiles + others:
+        name = row['name'] if len(row['name']) <= 40 else '...' + row['name'][-37:]
+        lines.append('%-40s %-8s %9.2f %9.2f %9.2f %10.1f' % (
+            name, row['type'], row['wall'], row['user'], row['system'], row['memory'] / float(1 << 20)
+        ))
+    total_user = sum(row['user'] for row in rows)
+    total_system = sum(row['system'] for row in rows)
+    lines.append('%d commands, %.2fs user, %.2fs sys' % (len(rows), total_user, total_system))
+    return '\n'.join(lines)
+
+
+def write_profile(rows, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'commands': rows}, file, indent=2)
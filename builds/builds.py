@@ -1,16 +1,20 @@
 #!/usr/bin/python3
-import json
-import multiprocessing
+import time
+
+STARTED = time.monotonic()
+
+import marshal
 import os
+import sys
 import click
 
 from termcolor import colored
-from buildpipeline import BuildPipeline
-from commandpreprocessor import CommandPreprocessor
-from watcher import Watcher
-from colorama import init
 
-init()  # colorama to work on all platforms
+# Subcommands import the modules they need themselves, so that starting builds stays fast for the quick commands
+
+if os.name == 'nt':
+    from colorama import init
+    init()  # colorama to work on windows
 
 DEFAULT_BUILDS_CONFIGURATION = {
     'projects' : {
@@ -28,21 +32,25 @@ DEFAULT_BUILDS_CONFIGURATION = {
                         "-g",
                         "-std=c++11"
                     ],
-                    "debug": True
+                    "debug": True,
+                    "fast-link": True
                 },
                 "release": {
                     "arguments": [
                         "-std=c++11"
                     ],
-                    "debug": False
+                    "debug": False,
+                    "fast-link": False
                 }
             }
         }
     }
 }
 
-builds_configuration = {}
-active_configuration = {}
+active_configuration = None
+builds_file = None
+config_load_started = None
+config_load_finished = None
 
 BUILDSFILENAME = '.buildsfile'
 
@@ -61,21 +69,55 @@ def search_config_path():
     return found_path
 
 
-builds_file = search_config_path()
+def config_path():
+    global builds_file
+    if builds_file is None:
+        builds_file = search_config_path()
+    return builds_file
+
+
+def config_cache_path():
+    return os.path.join(state_directory(), 'config.cache')
+
+
+def config_key():
+    st = os.stat(config_path())
+    return st.st_mtime_ns, st.st_size
+
+
+def write_config_cache(config):
+    """Stores the parsed builds file together with the stat of the builds file it was parsed from"""
+    try:
+        os.makedirs(state_directory(), exist_ok=True)
+        temporary = config_cache_path() + '.tmp' + str(os.getpid())
+        with open(temporary, 'wb') as file:
+            marshal.dump((config_key(), config), file)
+        os.replace(temporary, config_cache_path())
+    except (OSError, ValueError):
+        pass
 
 
 def save_configuration(config):
-    with open(builds_file, 'w', encoding='utf-8') as file:
+    import json
+    with open(config_path(), 'w', encoding='utf-8') as file:
         json.dump(config, file, indent=4)
+    write_config_cache(config)
 
 
-if os.path.exists(builds_file):
-    with open(builds_file, mode='r', encoding='utf-8') as file:
-        builds_configuration = json.load(file)
-else:
-    if input(colored('Builds not initialized.', 'red') +
-             ' Do you want to initialize a new builds file in the current directory? (y/N) ') == 'y':
-        save_configuration(DEFAULT_BUILDS_CONFIGURATION)
+def load_configuration():
+    """Reads the builds file, or its pre-parsed copy when the builds file did not change since it was cached"""
+    try:
+        with open(config_cache_path(), mode='rb') as file:
+            key, config = marshal.load(file)
+        if tuple(key) == config_key():
+            return merge_two_dicts(DEFAULT_BUILDS_CONFIGURATION, config)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    import json
+    with open(config_path(), mode='r', encoding='utf-8') as file:
+        config = json.load(file)
+    write_config_cache(config)
+    return merge_two_dicts(DEFAULT_BUILDS_CONFIGURATION, config)
 
 
 def merge_two_dicts(x, y):
@@ -83,10 +125,35 @@ def merge_two_dicts(x, y):
     z.update(y)
     return z
 
-active_configuration = merge_two_dicts(DEFAULT_BUILDS_CONFIGURATION, builds_configuration)
+
+def configuration():
+    """Returns the active configuration, loaded on first use. Only init works without a builds file."""
+    global active_configuration, config_load_started, config_load_finished
+    if active_configuration is None:
+        config_load_started = time.monotonic()
+        if not os.path.exists(config_path()):
+            click.echo(colored('Builds not initialized.', 'red') +
+                       ' Run builds init to create a new builds file in the current directory.')
+            sys.exit(os.EX_CONFIG)
+        active_configuration = load_configuration()
+        config_load_finished = time.monotonic()
+    return active_configuration
+
+
+def active_project():
+    return configuration().get('default_project', 'default')
+
+
+def state_directory():
+    return os.path.join(os.path.dirname(config_path()), '.builds')
+
+
+def metrics_path():
+    return os.path.join(state_directory(), 'metrics.jsonl')
 
 
 def output_settings(settings_out):
+    import json
     click.echo(colored(json.dumps(settings_out, sort_keys=True, indent=2), 'green'))
 
 
@@ -96,11 +163,15 @@ def process_command_string(string, current_project, current_file = ''):
     return string
 
 
+def normalize_filename(filename):
+    return filename.replace('./', '')
+
+
 def add_file(file_list, filename):
-    filename = filename.replace('./', '')
+    filename = normalize_filename(filename)
     if os.path.isdir(filename):
         print('Dir')
-    file_list.append(filename)
+    file_list.add(filename)
     click.echo(colored('+ ', 'green') + filename)
 
 
@@ -155,6 +226,18 @@ def builds():
     """
 
 
+@builds.command('init')
+def init():
+    """Create a new builds file in the current directory."""
+    global builds_file
+    if os.path.exists(BUILDSFILENAME):
+        click.echo(colored('# ', 'yellow') + BUILDSFILENAME + colored(' already exists', 'yellow'))
+        return
+    builds_file = BUILDSFILENAME
+    save_configuration(DEFAULT_BUILDS_CONFIGURATION)
+    click.echo(colored('+ ', 'green') + BUILDSFILENAME)
+
+
 @builds.group('project')
 def project():
     """Displays the currently active settings."""
@@ -163,24 +246,25 @@ def project():
 @project.command('show')
 def project_show():
     """Show the currently active project name"""
-    default_project = active_configuration.get('default_project', 'default')
+    default_project = active_project()
     print(default_project)
 
 
 @project.command('rename')
 @click.argument('newname', nargs=1, type=str)
-@click.option('target', '-p', default=active_configuration.get('default_project', 'default'),
+@click.option('target', '-p', default='',
               help='Rename the given project instead of the currently active project')
 def project_rename(newname, target):
     """Rename the currently active project"""
-    default_project = active_configuration.get('default_project', 'default')
-    projects = active_configuration.get('projects', {'default': {}})
+    default_project = active_project()
+    target = target or default_project
+    projects = configuration().get('projects', {'default': {}})
     project_settings = projects.get(target)
     projects.pop(target, None)
     projects[newname] = project_settings
     if default_project == target:
-        active_configuration['default_project'] = newname
-    save_configuration(active_configuration)
+        configuration()['default_project'] = newname
+    save_configuration(configuration())
 
 
 @builds.group('settings')
@@ -191,7 +275,7 @@ def settings():
 @settings.command('print')
 def print_settings():
     """Displays the currently active settings."""
-    output_settings(active_configuration)
+    output_settings(configuration())
 
 
 @builds.command('add-library')
@@ -200,8 +284,8 @@ def print_settings():
 def add_library(args, path):
 
     # Figure out correct variables
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
+    default_project = configuration().setdefault('default_project', 'default')
+    projects = configuration().setdefault('projects', {'default':{}})
     project_settings = projects.get(default_project)
     build_settings = project_settings.get("build-settings")
     libs = build_settings.get('libraries')
@@ -227,7 +311,7 @@ def add_library(args, path):
         else:
             print(colored('# ', 'yellow') + lib + colored(' Already configured', 'yellow'))
     
-    save_configuration(active_configuration)
+    save_configuration(configuration())
 
 
 @builds.command('add-shared-library')
@@ -236,8 +320,8 @@ def add_library(args, path):
 def add_shared_library(args, path):
 
     # Figure out correct variables
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
+    default_project = configuration().setdefault('default_project', 'default')
+    projects = configuration().setdefault('projects', {'default':{}})
     project_settings = projects.get(default_project)
     build_settings = project_settings.get("build-settings")
     libs = build_settings.get('libraries')
@@ -263,7 +347,7 @@ def add_shared_library(args, path):
         else:
             print(colored('# ', 'yellow') + lib + colored(' Already configured', 'yellow'))
     
-    save_configuration(active_configuration)
+    save_configuration(configuration())
 
 
 @builds.command('add-include')
@@ -271,8 +355,8 @@ def add_shared_library(args, path):
 def add_include(args):
 
     # Figure out correct variables
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
+    default_project = configuration().setdefault('default_project', 'default')
+    projects = configuration().setdefault('projects', {'default':{}})
     project_settings = projects.get(default_project)
     build_settings = project_settings.get("build-settings")
     inc_paths = build_settings.get('include-paths')
@@ -288,7 +372,7 @@ def add_include(args):
             else:
                 print(colored('# path ', 'yellow') + path + colored(' Already configured', 'yellow'))
     
-    save_configuration(active_configuration)
+    save_configuration(configuration())
 
 
 @builds.command('add')
@@ -298,109 +382,209 @@ def add_include(args):
                    'and asks if you want to add them or not.')
 def add(files, interactive):
     """Add file(s) to the build."""
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
+    from filelist import FileList
+
+    default_project = configuration().setdefault('default_project', 'default')
+    projects = configuration().setdefault('projects', {'default':{}})
     project_settings = projects.get(default_project)
-    project_files = project_settings.setdefault('files', [])
-    added_files = 0
+    project_files = FileList(project_settings.setdefault('files', []))
     if not interactive:
-        for filename in files:
-            if not os.path.isfile(filename):
-                continue
-            if filename not in project_files:
-                add_file(project_files, filename)
-                added_files += 1
+        candidates = [normalize_filename(filename) for filename in files if os.path.isfile(filename)]
+        added = project_files.add_all(candidates)
+        new_files = FileList(added)
+        for filename in candidates:
+            if new_files.remove(filename):
+                click.echo(colored('+ ', 'green') + filename)
             else:
                 click.echo(colored('# ', 'yellow') + filename + colored(" already in project", 'yellow'))
+        added_files = len(added)
     else:
         added_files = add_interactive(project_files)
+    project_settings['files'] = project_files.to_list()
     click.echo("Added " + str(added_files) + " files")
-    save_configuration(active_configuration)
+    save_configuration(configuration())
 
 
 @builds.command('remove')
 @click.argument('files', nargs=-1, type=str)
 def remove(files):
     """Remove file(s) from the build."""
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
+    from filelist import FileList
+
+    default_project = configuration().setdefault('default_project', 'default')
+    projects = configuration().setdefault('projects', {'default':{}})
     project_settings = projects.get(default_project)
-    project_files = project_settings.setdefault('files', [])
-    removed_files = 0
+    project_files = FileList(project_settings.setdefault('files', []))
+    removed = project_files.remove_all(files)
+    removed_files = FileList(removed)
     for filename in files:
-        if filename in project_files:
-            project_files.remove(filename)
+        if removed_files.remove(filename):
             click.echo(colored('- ', 'red') + filename)
-            removed_files += 1
         else:
             click.echo(colored('# ', 'yellow') + filename + colored(" not in project", 'yellow'))
-    click.echo("Removed " + str(removed_files) + " files")
-    save_configuration(active_configuration)
-
-
-@builds.command('build')
-@click.argument('project_name', default=active_configuration.get('default_project', 'default'))
-@click.option('target', '--target', default='debug', help='Select target to build (debug/release)')
-@click.option('verbose', '--verbose', flag_value=True, help='Verbose command output')
-@click.option('rebuild', '--rebuild', flag_value=True, help='Clean and re-build .o files')
-@click.option('machine', '--machine', flag_value=True, help='Machine-readable compiler messages')
-@click.option('jobs', '--jobs', default=multiprocessing.cpu_count(),
-              help='Run commands in parallel with x amount of jobs')
-@click.option('run', '--run', flag_value=True, help='Run executable output after building')
-def build(project_name, target, verbose, rebuild, machine, jobs, run):
-    """This builds the selected project with the current settings in BUILDSFILENAME file. 
-    Selected project defaults to the currently active project set in the BUILDSFILENAME file."""
-
-    projects = active_configuration.setdefault('projects', {'default': {}})
-
-    if projects is None:
-        click.echo("No projects configured")
-        return
+    project_settings['files'] = project_files.to_list()
+    click.echo("Removed " + str(len(removed)) + " files")
+    save_configuration(configuration())
 
-    project_settings = projects.get(project_name)
 
+def project_pipeline_configuration(project_name, project_settings, target, options):
+    """Returns the pipeline configuration of a project target with the given command line options, or None when the
+    project can not be built"""
     if project_settings is None:
         click.echo("No project found with name " + project_name)
-        return
+        return None
 
-    project_files = project_settings.setdefault('files', [])
     build_settings = project_settings.get('build-settings', [])
-    project_libraries = build_settings.get('libraries', [])
-    project_library_paths = build_settings.get('library-paths', [])
-    project_shared_library_paths = build_settings.get('shared-library-paths', [])
-    project_include_paths = build_settings.get('include-paths', [])
     targets = project_settings.get('targets')
     project_target = targets.get(target)
-    target_arguments = project_target.get('arguments')
-    project_pipeline = project_settings.get('pipeline')
 
-    if project_pipeline is None:
+    if project_settings.get('pipeline') is None:
         click.echo('No pipeline set for project ' + project_name)
-        return
+        return None
 
     pipeline_configuration = {
+        'target' : target,
+        'libraries' : build_settings.get('libraries', []),
+        'library-paths' : build_settings.get('library-paths', []),
+        'shared-library-paths' : build_settings.get('shared-library-paths', []),
+        'include-paths' : build_settings.get('include-paths', []),
+        'arguments' : project_target.get('arguments'),
+        'debug' : project_target.get('debug', False),
+        'fast-link' : project_target.get('fast-link', False),
+        'split-dwarf' : project_target.get('split-dwarf', False),
+        'shell' : project_target.get('shell', project_settings.get('shell', False)),
+        'steps' : project_settings.get('steps', []),
+        'precompiled-header' : project_settings.get('precompiled-header'),
+        'archives' : project_settings.get('archives', False),
+        'state-directory' : state_directory()
+    }
+    pipeline_configuration.update(options)
+    return pipeline_configuration
+
+
+def link_summary(command, history):
+    """Returns the time a link took, next to the latest times of the same link with other linkers"""
+    linker = command.linker or 'default'
+    summary = 'Link ' + command.displayName + ': ' + '%.2f' % command.duration + 's with ' + linker + ' linker'
+    others = sorted(history.get(command).get('linkers', {}).items())
+    before = ['%.2fs with %s linker' % (time, other) for other, time in others if other != linker]
+    if before:
+        summary += ', was ' + ', '.join(before)
+    return summary
+
+
+@builds.command('build')
+@click.argument('project_name', default='')
+@click.option('target', '--target', default='debug', help='Select target to build (debug/release)')
+@click.option('verbose', '--verbose', flag_value=True, help='Verbose command output')
+@click.option('rebuild', '--rebuild', flag_value=True, help='Clean and re-build .o files')
+@click.option('machine', '--machine', flag_value=True, help='Machine-readable compiler messages')
+@click.option('jobs', '--jobs', default=os.cpu_count(),
+              help='Run commands in parallel with x amount of jobs')
+@click.option('run', '--run', flag_value=True, help='Run executable output after building')
+@click.option('explain', '--explain', flag_value=True,
+              help='Print why each command runs, and with --verbose which commands are up to date')
+@click.option('dry_run', '-n', '--dry-run', flag_value=True,
+              help='Print the commands that would run and why, without running anything')
+@click.option('unity', '--unity', is_flag=True, help='Compile the files in unity batches')
+@click.option('unity_budget', '--unity-budget', default=10.0, type=float,
+              help='Seconds of compile time of every unity batch')
+@click.option('max_load', '--max-load', default=0.0,
+              help='Do not start new commands while more than this many processes are running on the system')
+@click.option('max_memory', '--max-memory', default='',
+              help='Memory budget of the running commands, i.e. 48G, using peak memory learned from earlier builds')
+@click.option('trace', '--trace', default='', help='Write a Chrome trace event timeline of the build to a file')
+@click.option('profile', '--profile', flag_value=True,
+              help='Show the CPU time and peak memory of the heaviest compiles and the link')
+@click.option('profile_top', '--profile-top', default=10, help='Amount of compiles shown by --profile')
+@click.option('profile_json', '--profile-json', default='', help='Write the resource usage of every command as json')
+@click.option('fail_fast', '--fail-fast', flag_value=True,
+              help='Stop running and queued commands on the first failure')
+@click.option('keep_going', '--keep-going', default=0,
+              help='Stop starting new commands after n failures, 0 to keep going until everything possible is built')
+@click.option('cache_dir', '--cache-dir', envvar='BUILDS_CACHE_DIR',
+              default=os.path.join(os.path.expanduser('~'), '.cache', 'builds'),
+              help='Directory of the compile cache')
+@click.option('cache_size', '--cache-size', envvar='BUILDS_CACHE_SIZE', default='5G',
+              help='Maximum size of the compile cache, i.e. 500M or 5G')
+@click.option('no_cache', '--no-cache', flag_value=True, help='Do not use the compile cache')
+@click.option('diagnostics', '--diagnostics', default='',
+              help='Write the compiler diagnostics to a file, as JSON Lines streamed during the build or as SARIF')
+@click.option('diagnostics_format', '--diagnostics-format', type=click.Choice(['jsonl', 'sarif']), default='jsonl',
+              help='Format of the --diagnostics file')
+@click.option('workers', '--workers', envvar='BUILDS_WORKERS', default='',
+              help='Distribute compiling to builds workers, i.e. host1:7878,host2:7878')
+@click.option('worker_token', '--worker-token', envvar='BUILDS_WORKER_TOKEN', default='',
+              help='Shared secret of the builds workers')
+def build(project_name, target, verbose, rebuild, machine, jobs, run, explain, dry_run, unity, unity_budget, max_load,
+          max_memory, trace, profile, profile_top, profile_json, fail_fast, keep_going, cache_dir, cache_size, no_cache,
+          diagnostics, diagnostics_format, workers, worker_token):
+    """This builds the selected project with the current settings in BUILDSFILENAME file. 
+    Selected project defaults to the currently active project set in the BUILDSFILENAME file."""
+    from buildpipeline import BuildPipeline
+    from commandpreprocessor import CommandPreprocessor
+    from compilecache import parse_size
+    from buildmetrics import MetricsStore, build_record
+
+    project_name = project_name or active_project()
+    project_settings = configuration().setdefault('projects', {'default': {}}).get(project_name)
+    pipeline_configuration = project_pipeline_configuration(project_name, project_settings, target, {
         'jobs' : jobs,
         'verbose' : verbose,
         'rebuild' : rebuild,
+        'explain' : explain,
+        'dry-run' : dry_run,
+        'unity' : unity_budget if unity else 0.0,
+        'fail-fast' : fail_fast,
+        'keep-going' : keep_going,
+        'max-load' : max_load,
+        'max-memory' : parse_size(max_memory) if max_memory else None,
         'machine-readable' : machine,
-        'libraries' : project_libraries,
-        'library-paths' : project_library_paths,
-        'shared-library-paths' : project_shared_library_paths,
-        'include-paths' : project_include_paths,
-        'arguments' : target_arguments
-    }
+        'cache-directory' : None if no_cache else cache_dir,
+        'cache-size' : cache_size,
+        'diagnostics' : diagnostics,
+        'diagnostics-format' : diagnostics_format,
+        'workers' : workers,
+        'worker-token' : worker_token
+    })
+    if pipeline_configuration is None:
+        return
+    project_files = project_settings.setdefault('files', [])
+    project_pipeline = project_settings.get('pipeline')
+
+    tracer = None
+    if trace:
+        from buildtrace import Tracer
+        tracer = Tracer(STARTED)
+        tracer.complete('start up', 'builds', STARTED, config_load_started)
+        tracer.complete('load configuration', 'builds', config_load_started, config_load_finished)
 
     pipeline = BuildPipeline(
         project_name,
         project_pipeline,
         CommandPreprocessor(project_name),
-        pipeline_configuration
+        pipeline_configuration,
+        tracer
     )
 
     if pipeline is None:
         click.echo('No pipeline configuration for pipeline ' + project_pipeline)
     
     stepsFinished = pipeline.run(project_files)
+    if dry_run:
+        return
+    MetricsStore(metrics_path()).append(
+        build_record(pipeline, project_name, target, jobs, time.monotonic() - STARTED)
+    )
+    if tracer:
+        tracer.write(trace)
+    if profile or profile_json:
+        from buildprofile import format_profile, profile_rows, write_profile
+        rows = profile_rows(pipeline.graph.commands)
+        if profile:
+            click.echo(format_profile(rows, profile_top))
+        if profile_json:
+            write_profile(rows, profile_json)
 
     if run and not pipeline.run_command_errors:
         if target == "debug":
@@ -411,18 +595,221 @@ def build(project_name, target, verbose, rebuild, machine, jobs, run):
             os.system("./"+project_name)
         stepsFinished += 1
     if not machine:
+        cache = pipeline.compile_cache
+        if cache and cache.hits + cache.misses > 0:
+            click.echo('Compile cache: ' + str(cache.hits) + ' hits, ' + str(cache.misses) + ' misses')
+        for command in pipeline.graph.commands:
+            if command.commandtype == 'build' and command.result == 'executed':
+                click.echo(link_summary(command, pipeline.history))
+        if pipeline.cutoff_commands > 0:
+            click.echo('Early cutoff: skipped ' + str(pipeline.cutoff_commands) +
+                       ' commands whose rebuilt inputs did not change')
+        if pipeline.executed_commands > 0:
+            click.echo('Makespan: estimated ' + '%.2f' % pipeline.estimated_makespan + 's, actual ' +
+                       '%.2f' % pipeline.makespan + 's')
+        admission = pipeline.admission
+        if admission and admission.throttled:
+            click.echo('Admission: ran up to ' + str(admission.peak_running) + ' of ' + str(admission.jobs) +
+                       ' jobs, held back ' + str(admission.throttled) + ' commands for load or memory')
+        if pipeline.uncached_compiles > 0:
+            reason = ''
+            if pipeline_configuration.get('split-dwarf'):
+                reason = ', split DWARF compiles write more than the object'
+            click.echo('Compile cache and workers: bypassed by ' + str(pipeline.uncached_compiles) + ' compiles' +
+                       reason)
+        remote = pipeline.remote_compiler
+        if remote:
+            click.echo('Remote workers: ' + str(remote.remote_jobs) + ' compiled remotely, ' +
+                       str(remote.fallbacks) + ' fell back to local')
         click.echo('Finished ' + str(stepsFinished) + ' steps')
 
 
+@builds.command('stats')
+@click.argument('project_name', default='')
+@click.option('target', '--target', default='debug', help='Target to show (debug/release)')
+@click.option('last', '--last', default=10, help='Amount of recent builds shown')
+@click.option('window', '--window', default=10, help='Amount of earlier builds the baseline is taken from')
+@click.option('threshold', '--threshold', default=20.0, help='Percentage over the baseline counted as a regression')
+@click.option('min_duration', '--min-duration', default=0.1,
+              help='Seconds over the baseline a command must take to count as a regression')
+def stats(project_name, target, last, window, threshold, min_duration):
+    """Show build time trends and compile time regressions. Exits with status 1 when regressions are found."""
+    from buildmetrics import MetricsStore, detect_regressions
+
+    project_name = project_name or active_project()
+    records = MetricsStore(metrics_path()).read(project_name, target)
+    if not records:
+        click.echo('No builds recorded for ' + project_name + ' ' + target)
+        return
+    click.echo('%-19s %8s %5s %9s %11s %8s %7s %7s' % ('time', 'wall s', 'jobs', 'executed', 'up-to-date', 'cut-off',
+                                                        'cached', 'failed'))
+    for record in records[-last:]:
+        counts = record.get('counts', {})
+        click.echo('%-19s %8.2f %5d %9d %11d %8d %7d %7d' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.get('time', 0))),
+            record.get('wall', 0.0),
+            record.get('jobs', 0),
+            counts.get('executed', 0),
+            counts.get('up-to-date', 0),
+            counts.get('cut-off', 0),
+            counts.get('cached', 0),
+            counts.get('failed', 0)
+        ))
+    regressions = detect_regressions(records, window, threshold, min_duration)
+    if not regressions:
+        click.echo(colored('No regressions', 'green'))
+        return
+    click.echo(colored(str(len(regressions)) + ' regression(s)', 'red'))
+    for output, duration, baseline in regressions:
+        click.echo('%-40s %8.2fs baseline %8.2fs %+7.1f%%' % (
+            output, duration, baseline, (duration / baseline - 1) * 100 if baseline else 0.0
+        ))
+    sys.exit(1)
+
+
+@builds.command('log')
+@click.argument('files', nargs=-1, type=str)
+@click.option('project_name', '-p', default='', help='Project to show, the active project by default')
+@click.option('target', '--target', default='debug', help='Target to show (debug/release)')
+@click.option('warnings', '--warnings', flag_value=True, help='Show only warnings')
+def log(files, project_name, target, warnings):
+    """Show the diagnostics of the last build of every file, including the files that were up to date, or of the
+    given files only."""
+    from diagnostics import format_diagnostic, parse_lines
+    from diagnosticslog import DiagnosticsLog
+
+    project_name = project_name or active_project()
+    diagnostics_log = DiagnosticsLog(os.path.join(state_directory(), project_name + '.' + target + '.diagnostics.json'))
+    selected = {os.path.normpath(filename) for filename in files}
+    counts = {'error': 0, 'warning': 0}
+    for outfile, record in diagnostics_log.records.items():
+        for diagnostic in parse_lines(record['lines'], outfile):
+            if warnings and diagnostic['severity'] != 'warning':
+                continue
+            paths = [record['input'], diagnostic['file']]
+            if selected and not any(path and os.path.normpath(path) in selected for path in paths):
+                continue
+            counts[diagnostic['severity']] = counts.get(diagnostic['severity'], 0) + 1
+            for line in format_diagnostic(diagnostic):
+                line = line.replace('error', colored('error', 'red'))
+                click.echo(line.replace('warning', colored('warning', 'yellow')))
+    click.echo(str(counts['warning']) + ' warnings, ' + str(counts['error']) + ' errors')
+
+
+@builds.group('analyze')
+def analyze():
+    """Analyzes the project."""
+
+
+@analyze.command('includes')
+@click.argument('project_name', default='')
+@click.option('target', '--target', default='debug', help='Target whose compile times are used (debug/release)')
+@click.option('top', '--top', default=20, help='Amount of headers and translation units shown')
+@click.option('output', '--json', default='', help='Write the whole analysis as json')
+def analyze_includes(project_name, target, top, output):
+    """Rank the headers by the compile time of the translation units rebuilt when they are touched, and show include
+    cycles and the heaviest includes of the costliest translation units. Uses the compiler dependency files of the
+    last build where available and scans the include directives otherwise."""
+    from buildpipeline import BuildPipeline
+    from commandpreprocessor import CommandPreprocessor
+    from includeanalysis import analyze_includes, format_includes, write_includes
+
+    project_name = project_name or active_project()
+    project_settings = configuration().setdefault('projects', {'default': {}}).get(project_name)
+    pipeline_configuration = project_pipeline_configuration(project_name, project_settings, target, {})
+    if pipeline_configuration is None:
+        return
+    pipeline = BuildPipeline(
+        project_name,
+        project_settings.get('pipeline'),
+        CommandPreprocessor(project_name),
+        pipeline_configuration
+    )
+    graph = pipeline.generate_graph(project_settings.get('files', []))
+    translation_units = [(command.infile, command.dependencies, pipeline.history.expected_duration(command))
+                         for command in graph.commands if command.commandtype == 'compile' and command.infile]
+    report = analyze_includes(translation_units, pipeline.include_paths, top, [pipeline.state_directory])
+    if output:
+        write_includes(report, output)
+    else:
+        click.echo(format_includes(report, top))
+
+
+@builds.command('worker')
+@click.option('host', '--host', default='127.0.0.1', help='Address to listen on, 0.0.0.0 for all interfaces')
+@click.option('port', '--port', default=0, help='Port to listen on, 7878 by default')
+@click.option('jobs', '--jobs', default=os.cpu_count(), help='Amount of parallel compile jobs')
+@click.option('token', '--token', envvar='BUILDS_WORKER_TOKEN', default='',
+              help='Shared secret required from the clients')
+@click.option('tools', '--allow-tool', multiple=True, help='Compiler allowed to be run, may be given several times')
+def worker(host, port, jobs, token, tools):
+    """Serve compile jobs for builds build --workers. Only run workers reachable by trusted clients."""
+    from worker import DEFAULT_WORKER_PORT, serve
+
+    port = port or DEFAULT_WORKER_PORT
+    click.echo(colored('Serving compile jobs', 'green') + ' on ' + host + ':' + str(port) +
+               ' with ' + str(jobs) + ' jobs')
+    serve(host, port, jobs, token, list(tools) or None)
+
+
 @builds.command('watch')
-def watch():
-    """Watch files for changes and run a build step on them if needed"""
-    default_project = active_configuration.setdefault('default_project', 'default')
-    projects = active_configuration.setdefault('projects', {'default':{}})
-    project_settings = projects.get(default_project)
-    project_files = project_settings.setdefault('files', [])
-    watcher = Watcher(project_files, None)
-    watcher.start()
+@click.argument('project_name', default='')
+@click.option('target', '--target', default='debug', help='Select target to build (debug/release)')
+@click.option('verbose', '--verbose', flag_value=True, help='Verbose command output and file events')
+@click.option('machine', '--machine', flag_value=True, help='Machine-readable compiler messages')
+@click.option('jobs', '--jobs', default=os.cpu_count(),
+              help='Run commands in parallel with x amount of jobs')
+@click.option('debounce', '--debounce', default=0.1,
+              help='Seconds to wait for more changes after a file changed before building')
+@click.option('cache_dir', '--cache-dir', envvar='BUILDS_CACHE_DIR',
+              default=os.path.join(os.path.expanduser('~'), '.cache', 'builds'),
+              help='Directory of the compile cache')
+@click.option('cache_size', '--cache-size', envvar='BUILDS_CACHE_SIZE', default='5G',
+              help='Maximum size of the compile cache, i.e. 500M or 5G')
+@click.option('no_cache', '--no-cache', flag_value=True, help='Do not use the compile cache')
+@click.option('diagnostics', '--diagnostics', default='',
+              help='Write the compiler diagnostics of every build to a file, as JSON Lines or as SARIF')
+@click.option('diagnostics_format', '--diagnostics-format', type=click.Choice(['jsonl', 'sarif']), default='jsonl',
+              help='Format of the --diagnostics file')
+def watch(project_name, target, verbose, machine, jobs, debounce, cache_dir, cache_size, no_cache, diagnostics,
+          diagnostics_format):
+    """Watch the project files and the headers they include, and rebuild on every save. The configuration, build
+    graph and file state are kept in memory between builds."""
+    from buildpipeline import BuildPipeline
+    from buildmetrics import MetricsStore, build_record
+    from commandpreprocessor import CommandPreprocessor
+    from watchbuild import WatchBuild
+    from watcher import Watcher
+
+    project_name = project_name or active_project()
+    options = {
+        'jobs' : jobs,
+        'verbose' : verbose,
+        'machine-readable' : machine,
+        'cache-directory' : None if no_cache else cache_dir,
+        'cache-size' : cache_size,
+        'diagnostics' : diagnostics,
+        'diagnostics-format' : diagnostics_format
+    }
+
+    def create_pipeline():
+        project_settings = load_configuration().get('projects', {}).get(project_name)
+        pipeline_configuration = project_pipeline_configuration(project_name, project_settings, target, options)
+        if pipeline_configuration is None:
+            sys.exit(os.EX_CONFIG)
+        pipeline = BuildPipeline(
+            project_name,
+            project_settings.get('pipeline'),
+            CommandPreprocessor(project_name),
+            pipeline_configuration
+        )
+        return pipeline, project_settings.get('files', [])
+
+    def finished(pipeline, wall):
+        MetricsStore(metrics_path()).append(build_record(pipeline, project_name, target, jobs, wall))
+
+    watcher = Watcher(WatchBuild(create_pipeline, config_path(), finished), debounce)
+    watcher.start(verbose)
 
 
 @builds.group('set')
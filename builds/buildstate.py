@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def command_signature(command):
+    return hashlib.sha1(str(command).encode('utf-8')).hexdigest()
+
+
+class BuildState:
+    """Persistent record of how every output of a project target was last built. For each output the command
+    signature, the output stat tuple and the stat tuple and content hash of every input are kept, so a command
+    only runs again when its flags or the content of its inputs actually changed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.stats = {}
+        self.hashes = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                self.records = json.load(file)
+        except ValueError:
+            self.records = {}
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self.records, file, separators=(',', ':'))
+        self.changed = False
+
+    def stat_all(self, paths):
+        """Stats every path not seen yet during this run in one pass"""
+        for path in paths:
+            if path not in self.stats:
+                try:
+                    st = os.stat(path)
+                    self.stats[path] = [st.st_mtime_ns, st.st_size]
+                except OSError:
+                    self.stats[path] = None
+
+    def stat(self, path):
+        if path not in self.stats:
+            self.stat_all([path])
+        return self.stats[path]
+
+    def forget(self, path):
+        self.stats.pop(path, None)
+        self.hashes.pop(path, None)
+
+    def hash(self, path):
+        digest = self.hashes.get(path)
+        if digest is None:
+            digest = hash_file(path)
+            self.hashes[path] = digest
+        return digest
+
+    def is_up_to_date(self, command):
+        return self.explain(command) is None
+
+    def explain(self, command):
+        """Returns why a command has to run, or None when it is up to date"""
+        if command.infile == command.outfile:
+            return 'writes its own input'
+        if self.stat(command.outfile) is None:
+            return 'output ' + command.outfile + ' is missing'
+        record = self.records.get(command.outfile)
+        if record is None:
+            return 'no record of building ' + command.outfile
+        signature, output_stat, inputs = record
+        if signature != command_signature(command.command):
+            return 'command line or flags changed'
+        if output_stat != self.stat(command.outfile):
+            return 'output ' + command.outfile + ' was changed outside of the build'
+        paths = command.inputs()
+        recorded = {entry[0]: entry for entry in inputs}
+        for path in paths:
+            if path not in recorded:
+                return 'new input ' + path
+        if len(paths) != len(inputs):
+            used = set(paths)
+            return 'input ' + next(entry[0] for entry in inputs if entry[0] not in used) + ' is no longer used'
+        for path in paths:
+            entry = recorded[path]
+            current = self.stat(path)
+            if current is None:
+                return 'input ' + path + ' is missing'
+            if entry[1:3] == current:
+                continue
+            if entry[2] != current[1] or entry[3] != self.hash(path):
+                header = command.depfile and path != command.infile
+                return ('header ' if header else 'input ') + path + ' changed'
+            entry[1:3] = current
+            self.changed = True
+        return None
+
+    def changed_inputs(self, command):
+        """Returns the inputs of a command that changed since it last ran, or None when the command has to run from
+        scratch because it is new, its command line changed or its output was changed outside of the build"""
+        record = self.records.get(command.outfile)
+        if record is None or self.stat(command.outfile) is None:
+            return None
+        signature, output_stat, inputs = record
+        if signature != command_signature(command.command) or output_stat != self.stat(command.outfile):
+            return None
+        recorded = {entry[0]: entry for entry in inputs}
+        changed = []
+        for path in command.inputs():
+            entry = recorded.get(path)
+            current = self.stat(path)
+            if entry is None or current is None:
+                changed.append(path)
+            elif entry[1:3] != current and (entry[2] != current[1] or entry[3] != self.hash(path)):
+                changed.append(path)
+        return changed
+
+    def inputs_changed(self, command):
+        """Tells whether the inputs of a command were touched since it was last built, without hashing them"""
+        record = self.records.get(command.outfile)
+        if record is None:
+            return True
+        return any(entry[1:3] != self.stat(entry[0]) for entry in record[2])
+
+    def record(self, command):
+        """Records a successfully built command"""
+        self.forget(command.outfile)
+        output_stat = self.stat(command.outfile)
+        if output_stat is None:
+            self.records.pop(command.outfile, None)
+            self.changed = True
+            return
+        inputs = []
+        for path in command.inputs():
+            current = self.stat(path)
+            if current is None:
+                continue
+            inputs.append([path] + current + [self.hash(path)])
+        self.records[command.outfile] = [command_signature(command.command), output_stat, inputs]
+        self.changed = True
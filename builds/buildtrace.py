@@ -0,0 +1,67 @@
+import heapq
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+TOOL_THREAD = 0
+
+
+class Tracer:
+    """Records a build timeline in the Chrome trace event format, viewable in Perfetto or chrome://tracing. The
+    tool's own work is on the first thread, commands are placed on the worker slot they ran on."""
+
+    def __init__(self, origin=None):
+        self.origin = time.monotonic() if origin is None else origin
+        self.events = []
+        self.free_slots = []
+        self.slot_count = 0
+        self.lock = threading.Lock()
+
+    def timestamp(self, moment):
+        return int((moment - self.origin) * 1000000)
+
+    def complete(self, name, category, start, end, thread=TOOL_THREAD, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self.timestamp(start),
+            'dur': max(0, self.timestamp(end) - self.timestamp(start)),
+            'pid': os.getpid(),
+            'tid': thread
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, category='builds', args=None):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, time.monotonic(), TOOL_THREAD, args)
+
+    def acquire_slot(self):
+        with self.lock:
+            if self.free_slots:
+                return heapq.heappop(self.free_slots)
+            self.slot_count += 1
+            return self.slot_count
+
+    def release_slot(self, slot):
+        with self.lock:
+            heapq.heappush(self.free_slots, slot)
+
+    def write(self, path):
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': TOOL_THREAD,
+                     'args': {'name': 'builds'}}]
+        for slot in range(1, self.slot_count + 1):
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': slot,
+                             'args': {'name': 'slot ' + str(slot)}})
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, file)
@@ -1,9 +1,41 @@
+import shlex
+
+
+def command_arguments(tool, arguments, shell=False):
+    """Returns the command of a tool with its arguments as an argument list, each argument string split like a
+    shell would split it. Steps opting in to the shell get a single command string run by the shell instead."""
+    if shell:
+        return " ".join([tool] + [str(x) for x in arguments])
+    command = shlex.split(tool)
+    for argument in arguments:
+        command.extend(shlex.split(str(argument)))
+    return command
+
+
+def append_arguments(command, arguments):
+    """Appends arguments, such as file names, to an argument list or to a shell command string"""
+    if isinstance(command, str):
+        return command + "".join(" " + shlex.quote(str(x)) for x in arguments)
+    return command + [str(x) for x in arguments]
+
+
+def command_text(command):
+    """Returns a command as it would be typed into a shell"""
+    if isinstance(command, str):
+        return command
+    return " ".join(shlex.quote(argument) for argument in command)
+
 
 class CommandPreprocessor:
     def __init__(self, current_project):
         self.current_project = current_project
 
-    def Process(self, string, current_file):
+    def Process(self, command, current_file):
+        """Substitutes $PROJECTNAME and $FILE in a command string, or in every argument of an argument list so
+        that file names with spaces stay a single argument"""
+        if not isinstance(command, str):
+            return [self.Process(argument, current_file) for argument in command]
+        string = command
         string = string.replace("$PROJECTNAME", self.current_project)
         string = string.replace("$FILE", current_file)
-        return string
\ No newline at end of file
+        return string
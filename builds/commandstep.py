@@ -0,0 +1,36 @@
+from buildcommand import BuildCommand
+from commandpreprocessor import append_arguments, command_arguments
+
+
+class CommandStep:
+    """Generic user defined step, configured in the project "steps" list. For example a code generator:
+
+        {"type": "command", "name": "protoc", "tool": "protoc", "arguments": ["--cpp_out=. $FILE"],
+         "input": "proto-files", "files": ["msg.proto"], "output": "files", "output-file": "$FILE.pb.cc"}
+
+    When output-file contains $FILE the tool runs once per input file, otherwise it runs once with all input files
+    appended to the command and $FILE standing for the output file. The tool is run directly with the arguments split
+    like a shell would split them, "shell": true runs the command through the shell instead."""
+
+    def __init__(self, command_processor):
+        self.command_processor = command_processor
+
+    def command(self, project_name, settings, files):
+        name = settings.get('name', 'command')
+        tool_command = command_arguments(settings.get('tool'), settings.get('arguments', []),
+                                         settings.get('shell', False))
+        output_file = settings.get('output-file', '')
+        commands = []
+        step_files = []
+        if '$FILE' in output_file:
+            for step_file in files:
+                outfile = self.command_processor.Process(output_file, step_file)
+                command = self.command_processor.Process(tool_command, step_file)
+                commands.append(BuildCommand(command, name, step_file, step_file, outfile))
+                step_files.append(outfile)
+        else:
+            outfile = self.command_processor.Process(output_file or name, project_name)
+            command = append_arguments(self.command_processor.Process(tool_command, outfile), files)
+            commands.append(BuildCommand(command, name, outfile, None, outfile, list(files)))
+            step_files.append(outfile)
+        return commands, step_files
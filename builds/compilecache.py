@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+SIZE_INDEX = 'size.json'
+# Eviction makes room below the limit, so that the next builds do not walk the cache again right away
+EVICT_TO = 0.9
+
+
+def parse_size(size):
+    """Parses sizes like 512M or 5G into bytes"""
+    size = str(size).strip().upper().rstrip('B')
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def copy_file(source, destination):
+    temporary = destination + '.tmp' + str(os.getpid()) + '.' + str(threading.get_ident())
+    shutil.copyfile(source, temporary)
+    os.replace(temporary, destination)
+
+
+class CompileCache:
+    """Local content addressed cache for compiled objects. Objects are keyed on the preprocessed source, the
+    normalized compile command and the toolchain version, and stored with the diagnostic lines their compile printed
+    so that a hit shows and logs the same warnings. The least recently used objects are evicted when
+    the cache grows over its size limit. The size of the cache is kept as a running total in an index file, so that
+    the cache is only walked when the total goes over the limit."""
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def toolchain_version(self, tool):
+        with self.lock:
+            if tool not in self.versions:
+                try:
+                    self.versions[tool] = subprocess.run(
+                        [tool, '--version'],
+                        stderr=subprocess.DEVNULL,
+                        stdout=subprocess.PIPE
+                    ).stdout
+                except OSError:
+                    self.versions[tool] = b''
+            return self.versions[tool]
+
+    def words(self, command):
+        if isinstance(command.command, str):
+            return command.command.split()
+        return command.command
+
+    def normalize(self, command):
+        words = []
+        for word in self.words(command):
+            if word == command.outfile:
+                word = '$OUT'
+            elif word == command.depfile:
+                word = '$DEP'
+            words.append(word)
+        return ' '.join(words)
+
+    def key(self, command):
+        """Returns the cache key of a compile command, or None if the source could not be preprocessed"""
+        preprocessed = command.preprocess()
+        if preprocessed is None:
+            return None
+        digest = hashlib.sha256()
+        digest.update(self.toolchain_version(self.words(command)[0]))
+        digest.update(b'\0' + self.normalize(command).encode('utf-8') + b'\0')
+        digest.update(preprocessed)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def fetch(self, key, outfile):
+        path = self.path(key)
+        try:
+            copy_file(path, outfile)
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def fetch_lines(self, key):
+        """Returns the diagnostic lines stored with an object, or None for objects stored without them"""
+        path = self.path(key) + '.lines'
+        try:
+            with open(path, mode='r', encoding='utf-8') as file:
+                lines = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return lines
+
+    def store(self, key, outfile, lines):
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            replaced = 0
+            for stored in (path, path + '.lines'):
+                try:
+                    replaced += os.stat(stored).st_size
+                except OSError:
+                    pass
+            copy_file(outfile, path)
+            temporary = path + '.lines.tmp' + str(os.getpid()) + '.' + str(threading.get_ident())
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(lines, file)
+            os.replace(temporary, path + '.lines')
+            size = os.stat(path).st_size + os.stat(path + '.lines').st_size
+        except OSError:
+            return
+        with self.lock:
+            self.stored += size - replaced
+
+    async def run(self, command, pipeline_configuration, execute, loop):
+        """Runs a compile command through the cache, awaiting execute(command) on a miss"""
+        key = await loop.run_in_executor(None, self.key, command)
+        if key is not None and await loop.run_in_executor(None, self.fetch, key, command.outfile):
+            command.preprocessed = None
+            command.print_status(pipeline_configuration, 'cached')
+            lines = await loop.run_in_executor(None, self.fetch_lines, key)
+            if lines is None:
+                # Stored before diagnostics were kept with the objects, what they printed is not known
+                command.output_lines = None
+            else:
+                command.replay(lines, pipeline_configuration)
+            command.success = True
+            return True
+        if not await execute(command):
+            return False
+        if key is not None:
+            await loop.run_in_executor(None, self.store, key, command.outfile, command.output_lines)
+        return True
+
+    def read_size(self):
+        try:
+            with open(os.path.join(self.directory, SIZE_INDEX), mode='r', encoding='utf-8') as file:
+                return int(json.load(file)['size'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_size(self, total):
+        path = os.path.join(self.directory, SIZE_INDEX)
+        temporary = path + '.tmp' + str(os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump({'size': total}, file)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Adds the objects stored by this build to the size total and, when it is over the size limit or unknown,
+        removes the least recently used objects until the cache is back below the limit"""
+        if self.stored == 0:
+            return
+        total = self.read_size()
+        if total is not None:
+            total += self.stored
+            self.stored = 0
+            if total <= self.max_size:
+                self.write_size(total)
+                return
+        self.stored = 0
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory:
+                # Objects live in the shard directories, the index is next to them
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.write_size(total)
@@ -0,0 +1,59 @@
+import sys
+import threading
+
+
+class ConsoleOutput:
+    """Keeps the output of concurrently running commands coherent. Status lines are printed right away. The first
+    command writing diagnostics owns the console and streams them as they arrive, while the output of the other
+    commands is held back and printed in one piece once the owner has finished."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.owner = None
+        self.pending = []
+        self.finished = set()
+
+    def emit(self, text):
+        self.stream.write(text if text.endswith('\n') else text + '\n')
+        self.stream.flush()
+
+    def status(self, command, text):
+        with self.lock:
+            if self.owner is None or self.owner is command:
+                self.emit(text)
+            else:
+                self.pending.append((None, text))
+
+    def write(self, command, text):
+        with self.lock:
+            if self.owner is None:
+                self.owner = command
+            if self.owner is command:
+                self.emit(text)
+            else:
+                self.pending.append((command, text))
+
+    def finish(self, command, discard=False):
+        """Marks the output of a command complete, discarding whatever of it is still held back if asked to"""
+        with self.lock:
+            if discard:
+                self.pending = [entry for entry in self.pending if entry[0] is not command]
+            self.finished.add(command)
+            if self.owner is command:
+                self.owner = None
+                self.release()
+            if not self.pending:
+                self.finished.clear()
+
+    def release(self):
+        remaining = []
+        for command, text in self.pending:
+            running = command is not None and command not in self.finished
+            if self.owner is None and running:
+                self.owner = command
+            if self.owner is None or self.owner is command:
+                self.emit(text)
+            else:
+                remaining.append((command, text))
+        self.pending = remaining
@@ -0,0 +1,69 @@
+import json
+import os
+import re
+
+DEPFILE_WORD = re.compile(r'(?:\\.|[^\s\\])+')
+
+
+def parse_depfile(path):
+    """Parses a make style dependency file written by the compiler (-MMD -MF) and returns its prerequisites"""
+    with open(path, mode='r', encoding='utf-8') as file:
+        content = file.read()
+    content = content.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    prerequisites = []
+    seen = set()
+    for word in DEPFILE_WORD.findall(content):
+        if word.endswith(':'):
+            continue
+        word = word.replace('\\ ', ' ').replace('\\#', '#').replace('$$', '$')
+        if word not in seen:
+            seen.add(word)
+            prerequisites.append(word)
+    return prerequisites
+
+
+class DependencyIndex:
+    """Keeps the parsed compiler dependency files between runs, so that header changes are noticed without
+    reading every dependency file again on each build"""
+
+    def __init__(self, path):
+        self.path = path
+        self.dependencies = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                self.dependencies = json.load(file)
+        except ValueError:
+            self.dependencies = {}
+
+    def get(self, outfile, depfile=None):
+        """Returns the known dependencies of an output, or None if they are not known yet"""
+        dependencies = self.dependencies.get(outfile)
+        if dependencies is None and depfile is not None:
+            dependencies = self.update(outfile, depfile)
+        return dependencies
+
+    def update(self, outfile, depfile):
+        try:
+            dependencies = parse_depfile(depfile)
+        except OSError:
+            self.dependencies.pop(outfile, None)
+            return None
+        self.dependencies[outfile] = dependencies
+        self.changed = True
+        return dependencies
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self.dependencies, file, separators=(',', ':'))
+        self.changed = False
@@ -0,0 +1,222 @@
+import json
+import re
+import threading
+
+SEVERITIES = {'fatal error': 'error', 'error': 'error', 'warning': 'warning', 'note': 'note', 'remark': 'note'}
+
+LOCATED = re.compile(
+    r'^(?P<file>.+?):(?P<line>\d+):(?:(?P<column>\d+):)? (?P<severity>fatal error|error|warning|note|remark): '
+    r'(?P<message>.*)$'
+)
+TOOL = re.compile(r'^(?P<tool>[^\s:]+): (?P<severity>fatal error|error|warning|note): (?P<message>.*)$')
+LINKER = re.compile(r'^(?P<location>.+?): (?P<message>(?:undefined reference to|multiple definition of) .*)$')
+INCLUDED = re.compile(r'^(?:In file included|\s+) from (?P<file>.+?):(?P<line>\d+)(?::(?P<column>\d+))?[:,]$')
+REQUIRED = re.compile(r'^(?P<file>.+?):(?P<line>\d+):(?:(?P<column>\d+):)?\s+(?P<message>required (?:from|by) .*)$')
+SCOPE = re.compile(r'^(?P<file>.+?): (?P<message>(?:In|At) .*:)$')
+LINKER_SCOPE = re.compile(r'^[^\s:]+: (?P<file>.+?): (?P<message>in function .*:)$')
+SOURCE_LINE = re.compile(r'^(?P<file>.+):(?P<line>\d+)$')
+OPTION = re.compile(r' \[(?P<option>-W[^\]]+)\]$')
+
+LINE_ERROR = 'error'
+LINE_WARNING = 'warning'
+LINE_NOTE = 'note'
+LINE_LINK_ERROR = 'link-error'
+LINE_CONTEXT = 'context'
+LINE_OTHER = 'other'
+
+
+def location(match):
+    return {
+        'file': match.group('file'),
+        'line': int(match.group('line')),
+        'column': int(match.group('column')) if match.group('column') else None
+    }
+
+
+class DiagnosticParser:
+    """Incremental parser of gcc, clang and linker output. Every line is matched once by a few anchored patterns,
+    so the parser takes linear time however long the output gets. feed(line) classifies the line right away and
+    returns the diagnostics it completed, a diagnostic being complete once the next one starts or close() is
+    called. Include chains, the function or instantiation being compiled and "required from" lines before a
+    diagnostic become its context, notes after it become its notes."""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.current = None
+        self.context = []
+        self.kind = LINE_OTHER
+        self.location = ''
+        self.message = ''
+
+    def diagnostic(self, severity, place, message):
+        option = OPTION.search(message)
+        diagnostic = {
+            'output': self.output,
+            'severity': severity,
+            'file': place.get('file'),
+            'line': place.get('line'),
+            'column': place.get('column'),
+            'message': message[:option.start()] if option else message,
+            'option': option.group('option') if option else None,
+            'context': self.context,
+            'notes': []
+        }
+        self.context = []
+        return diagnostic
+
+    def start(self, diagnostic):
+        completed = self.complete()
+        self.current = diagnostic
+        return completed
+
+    def complete(self):
+        if self.current is None:
+            return []
+        completed, self.current = self.current, None
+        return [completed]
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')
+        self.kind = LINE_OTHER
+        match = LOCATED.match(line)
+        if match:
+            severity = SEVERITIES[match.group('severity')]
+            self.location = match.group('file') + ':' + match.group('line') + (
+                ':' + match.group('column') if match.group('column') else '')
+            self.message = match.group('message')
+            if severity == 'note' and self.current is not None:
+                self.kind = LINE_NOTE
+                self.current['notes'].append(dict(location(match), message=match.group('message')))
+                return []
+            self.kind = severity
+            return self.start(self.diagnostic(severity, location(match), match.group('message')))
+        match = TOOL.match(line)
+        if match:
+            severity = SEVERITIES[match.group('severity')]
+            self.kind = severity
+            self.location = match.group('tool')
+            self.message = match.group('message')
+            return self.start(self.diagnostic(severity, {}, match.group('tool') + ': ' + match.group('message')))
+        match = LINKER.match(line)
+        if match:
+            self.kind = LINE_LINK_ERROR
+            self.location = match.group('location')
+            self.message = match.group('message')
+            source = SOURCE_LINE.match(match.group('location'))
+            place = {'file': source.group('file'), 'line': int(source.group('line'))} if source else {}
+            diagnostic = self.diagnostic('error', place, match.group('message'))
+            diagnostic['object'] = None if source else match.group('location')
+            return self.start(diagnostic)
+        for pattern in (INCLUDED, REQUIRED, SCOPE, LINKER_SCOPE):
+            match = pattern.match(line)
+            if match:
+                self.kind = LINE_CONTEXT
+                self.message = line.strip()
+                completed = self.complete()
+                entry = {'file': match.group('file'), 'line': None, 'column': None, 'message': line.strip()}
+                if pattern in (INCLUDED, REQUIRED):
+                    entry.update(location(match))
+                self.context.append(entry)
+                return completed
+        return []
+
+    def close(self):
+        self.context = []
+        return self.complete()
+
+
+def format_place(place):
+    text = place['file']
+    for key in ('line', 'column'):
+        if place.get(key):
+            text += ':' + str(place[key])
+    return text
+
+
+def format_diagnostic(diagnostic):
+    """Returns the lines of a diagnostic as a compiler would print them, its context first and its notes last"""
+    lines = [entry['message'] for entry in diagnostic['context']]
+    message = diagnostic['message'] + (' [' + diagnostic['option'] + ']' if diagnostic.get('option') else '')
+    if diagnostic.get('file'):
+        lines.append(format_place(diagnostic) + ': ' + diagnostic['severity'] + ': ' + message)
+    elif diagnostic.get('object'):
+        lines.append(diagnostic['object'] + ': ' + message)
+    else:
+        lines.append(message)
+    lines.extend(format_place(note) + ': note: ' + note['message'] for note in diagnostic['notes'])
+    return lines
+
+
+def parse_lines(lines, output=None):
+    """Returns the diagnostics of a list of output lines"""
+    parser = DiagnosticParser(output)
+    diagnostics = []
+    for line in lines:
+        diagnostics.extend(parser.feed(line))
+    diagnostics.extend(parser.close())
+    return diagnostics
+
+
+class DiagnosticsWriter:
+    """Writes the diagnostics of a build to a file, as JSON Lines written as soon as each diagnostic is parsed, or
+    as a SARIF log written when the build ends"""
+
+    def __init__(self, path, format='jsonl'):
+        self.path = path
+        self.format = format
+        self.lock = threading.Lock()
+        self.diagnostics = []
+        self.file = open(path, 'w', encoding='utf-8') if format == 'jsonl' else None
+
+    def write(self, diagnostic):
+        with self.lock:
+            if self.file is not None:
+                self.file.write(json.dumps(diagnostic, separators=(',', ':')) + '\n')
+                self.file.flush()
+            else:
+                self.diagnostics.append(diagnostic)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            elif self.format == 'sarif':
+                with open(self.path, 'w', encoding='utf-8') as file:
+                    json.dump(sarif_log(self.diagnostics), file, indent=2)
+
+
+def sarif_location(place, message=None):
+    physical = {'artifactLocation': {'uri': place['file']}}
+    if place.get('line'):
+        physical['region'] = {'startLine': place['line']}
+        if place.get('column'):
+            physical['region']['startColumn'] = place['column']
+    sarif = {'physicalLocation': physical}
+    if message:
+        sarif['message'] = {'text': message}
+    return sarif
+
+
+def sarif_log(diagnostics):
+    """Returns diagnostics as a SARIF 2.1.0 log"""
+    results = []
+    for diagnostic in diagnostics:
+        result = {
+            'level': diagnostic['severity'] if diagnostic['severity'] in ('error', 'warning') else 'note',
+            'message': {'text': diagnostic['message']}
+        }
+        if diagnostic.get('option'):
+            result['ruleId'] = diagnostic['option']
+        if diagnostic.get('file'):
+            result['locations'] = [sarif_location(diagnostic)]
+        related = [sarif_location(entry, entry['message'])
+                   for entry in diagnostic['context'] + diagnostic['notes'] if entry.get('file')]
+        if related:
+            result['relatedLocations'] = related
+        results.append(result)
+    return {
+        'version': '2.1.0',
+        '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+        'runs': [{'tool': {'driver': {'name': 'builds'}}, 'results': results}]
+    }
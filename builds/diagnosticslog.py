@@ -0,0 +1,54 @@
+import json
+import os
+
+
+class DiagnosticsLog:
+    """Per project target log of the diagnostics every command printed when it last ran, keyed on the command
+    output. Only the lines the diagnostics parser recognized are kept, so the log stays small, and replaying them
+    through the parser gives back the same diagnostics without running the command again."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                self.records = json.load(file)
+        except ValueError:
+            self.records = {}
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self.records, file, separators=(',', ':'))
+        self.changed = False
+
+    def lines(self, command):
+        return self.records.get(command.outfile, {}).get('lines', [])
+
+    def record(self, command):
+        """Records the diagnostic lines of a command that just ran"""
+        if command.output_lines:
+            self.records[command.outfile] = {'input': command.infile, 'lines': command.output_lines}
+            self.changed = True
+        else:
+            self.forget(command)
+
+    def forget(self, command):
+        if self.records.pop(command.outfile, None) is not None:
+            self.changed = True
+
+    def retain(self, outputs):
+        """Drops the records of outputs no longer built"""
+        for outfile in [outfile for outfile in self.records if outfile not in outputs]:
+            del self.records[outfile]
+            self.changed = True
@@ -0,0 +1,71 @@
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+# Fastest first
+LINKERS = ['mold', 'lld', 'gold']
+LINKER_PROGRAMS = {'mold': ['mold', 'ld.mold'], 'lld': ['ld.lld', 'lld'], 'gold': ['ld.gold', 'gold']}
+# Changed along with the probe, so that linkers found by an older probe are checked again
+PROBE_VERSION = 2
+PROBE_SOURCE = b'int main() { return 0; }\n'
+
+detected = {}
+
+
+def installed_linkers(linkers=LINKERS):
+    return [linker for linker in linkers
+            if any(shutil.which(program) for program in LINKER_PROGRAMS[linker])]
+
+
+def supports_linker(tool, linker):
+    """Tells whether the compiler driver tool can link with linker, by having it build a tiny program. Linking is
+    what tells apart linkers that can not write the executables of the target, such as gold for Windows."""
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            return subprocess.run(
+                shlex.split(tool) + ['-x', 'c++', '-', '-o', os.path.join(directory, 'probe'), '-fuse-ld=' + linker],
+                input=PROBE_SOURCE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            ).returncode == 0
+        except OSError:
+            return False
+
+
+def fast_linker(tool, cache_path=None, probe=True, linkers=LINKERS):
+    """Returns the fastest of linkers the compiler driver tool can use, or None to keep its default linker. The
+    result is remembered in cache_path for as long as the tool and the installed linkers stay the same. Without probe
+    only a remembered result is returned, the tool is not run."""
+    path = shutil.which(shlex.split(tool)[0]) if tool.strip() else None
+    if path is None:
+        return None
+    installed = installed_linkers(linkers)
+    key = [path, os.stat(path).st_mtime_ns, installed, PROBE_VERSION]
+    if tool in detected and detected[tool][0] == key:
+        return detected[tool][1]
+    cache = {}
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, mode='r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except ValueError:
+            cache = {}
+    entry = cache.get(tool)
+    if entry is not None and entry[0] == key:
+        linker = entry[1]
+    elif not probe:
+        return None
+    else:
+        linker = next((linker for linker in installed if supports_linker(tool, linker)), None)
+        if cache_path:
+            cache[tool] = [key, linker]
+            directory = os.path.dirname(cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as file:
+                json.dump(cache, file, separators=(',', ':'))
+    detected[tool] = (key, linker)
+    return linker
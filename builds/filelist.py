@@ -0,0 +1,40 @@
+class FileList:
+    """Ordered set of file paths. Membership tests, adding and removing take constant time and iteration keeps the
+    order in which the paths were added, so that project file lists of any size stay cheap to edit."""
+
+    def __init__(self, paths=()):
+        self.paths = dict.fromkeys(paths)
+
+    def __contains__(self, path):
+        return path in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, path):
+        """Adds a path, returns False when it was already in the list"""
+        if path in self.paths:
+            return False
+        self.paths[path] = None
+        return True
+
+    def remove(self, path):
+        """Removes a path, returns False when it was not in the list"""
+        if path not in self.paths:
+            return False
+        del self.paths[path]
+        return True
+
+    def add_all(self, paths):
+        """Adds the paths, returns the ones that were not in the list yet"""
+        return [path for path in paths if self.add(path)]
+
+    def remove_all(self, paths):
+        """Removes the paths, returns the ones that were in the list"""
+        return [path for path in paths if self.remove(path)]
+
+    def to_list(self):
+        return list(self.paths)
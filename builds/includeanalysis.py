@@ -0,0 +1,183 @@
+import json
+import os
+import re
+
+INCLUDE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.MULTILINE)
+
+
+def normalize(path):
+    """Normalizes a path, making paths below the current directory relative so that the absolute and relative paths
+    of the compiler dependency files and of the scanned includes match"""
+    path = os.path.normpath(path)
+    if os.path.isabs(path):
+        relative = os.path.relpath(path)
+        if not relative.startswith(os.pardir):
+            return relative
+    return path
+
+
+class IncludeGraph:
+    """Graph of the #include directives between the sources and headers of a project, found by scanning the files
+    for include lines. Quoted includes are looked up next to the including file and then in the include paths, angle
+    bracket includes in the include paths only, so system headers are left out."""
+
+    def __init__(self, include_paths):
+        self.include_paths = include_paths
+        self.includes = {}
+        self.sizes = {}
+
+    def resolve(self, name, directory, quoted):
+        candidates = [directory] if quoted else []
+        for candidate in candidates + list(self.include_paths):
+            path = normalize(os.path.join(candidate, name))
+            if path in self.includes or os.path.isfile(path):
+                return path
+        return None
+
+    def scan(self, path):
+        """Adds a file and everything it includes to the graph"""
+        pending = [normalize(path)]
+        while pending:
+            path = pending.pop()
+            if path in self.includes:
+                continue
+            self.includes[path] = []
+            try:
+                with open(path, mode='rb') as file:
+                    content = file.read()
+            except OSError:
+                self.sizes[path] = 0
+                continue
+            self.sizes[path] = len(content)
+            directory = os.path.dirname(path)
+            for match in INCLUDE.finditer(content):
+                name = match.group(2).decode('utf-8', 'replace').strip()
+                included = self.resolve(name, directory, match.group(1) == b'"')
+                if included is not None and included not in self.includes[path]:
+                    self.includes[path].append(included)
+                    pending.append(included)
+
+    def components(self):
+        """Returns the strongly connected components of the graph, every component after the ones it includes"""
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for root in self.includes:
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                path, position = work.pop()
+                if position == 0:
+                    index[path] = lowlink[path] = len(index)
+                    stack.append(path)
+                    on_stack.add(path)
+                includes = self.includes[path]
+                if position < len(includes):
+                    work.append((path, position + 1))
+                    included = includes[position]
+                    if included not in index:
+                        work.append((included, 0))
+                    elif included in on_stack:
+                        lowlink[path] = min(lowlink[path], index[included])
+                    continue
+                if lowlink[path] == index[path]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == path:
+                            break
+                    components.append(component)
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[path])
+        return components
+
+    def cycles(self):
+        """Returns the groups of files including each other"""
+        return [sorted(component) for component in self.components()
+                if len(component) > 1 or component[0] in self.includes[component[0]]]
+
+    def closures(self):
+        """Returns for every file the set of files it includes directly or indirectly"""
+        closures = {}
+        for component in self.components():
+            closure = set()
+            for path in component:
+                for included in self.includes[path]:
+                    closure.add(included)
+                    closure.update(closures.get(included, ()))
+            for path in component:
+                closures[path] = closure
+        return closures
+
+
+def analyze_includes(translation_units, include_paths, top=10, excluded=()):
+    """Analyzes the includes of translation units given as (source, dependencies, cost) tuples, the dependencies
+    being the ones of the compiler dependency file or None when unknown, completed by the scanned includes. Returns
+    the headers ranked by the compile time of the translation units rebuilt when they are touched, the include
+    cycles and the heaviest direct includes of every translation unit. Headers in the excluded directories, such
+    as the ones generated by the build, are left out."""
+    excluded = tuple(normalize(directory) + os.sep for directory in excluded)
+    graph = IncludeGraph(include_paths)
+    for source, dependencies, cost in translation_units:
+        graph.scan(source)
+    closures = graph.closures()
+    headers = {}
+    units = []
+    for source, dependencies, cost in translation_units:
+        source = normalize(source)
+        # Dependency files leave out the headers of a precompiled header, the scanned includes still have them
+        dependencies = set(normalize(path) for path in dependencies or ()) | closures.get(source, set())
+        for header in dependencies:
+            if header == source or header.startswith(excluded):
+                continue
+            entry = headers.setdefault(header, {'header': header, 'units': 0, 'cost': 0.0})
+            entry['units'] += 1
+            entry['cost'] += cost
+        includes = []
+        for included in graph.includes.get(source, []):
+            closure = closures.get(included, set()) | {included}
+            includes.append({
+                'header': included,
+                'files': len(closure),
+                'bytes': sum(graph.sizes.get(path, 0) for path in closure)
+            })
+        includes.sort(key=lambda include: include['bytes'], reverse=True)
+        units.append({'source': source, 'cost': cost, 'includes': includes[:top]})
+    ranked = sorted(headers.values(), key=lambda entry: (entry['cost'], entry['units']), reverse=True)
+    for entry in ranked:
+        entry['cost'] = round(entry['cost'], 4)
+    units.sort(key=lambda unit: unit['cost'], reverse=True)
+    return {'headers': ranked, 'cycles': graph.cycles(), 'units': units}
+
+
+def format_includes(report, top):
+    """Formats the top headers by rebuild cost, the include cycles and the heaviest includes of the costliest
+    translation units"""
+    lines = ['%-50s %6s %10s' % ('header', 'TUs', 'rebuild s')]
+    for entry in report['headers'][:top]:
+        header = entry['header'] if len(entry['header']) <= 50 else '...' + entry['header'][-47:]
+        lines.append('%-50s %6d %10.2f' % (header, entry['units'], entry['cost']))
+    if report['cycles']:
+        lines.append('')
+        lines.append(str(len(report['cycles'])) + ' include cycle(s)')
+        for cycle in report['cycles']:
+            lines.append('  ' + ' <-> '.join(cycle))
+    lines.append('')
+    lines.append('Heaviest includes of the costliest translation units')
+    for unit in report['units'][:top]:
+        lines.append('%s (%.2fs)' % (unit['source'], unit['cost']))
+        for include in unit['includes'][:3]:
+            lines.append('  %-48s %6d files %8.1f KB' % (include['header'], include['files'],
+                                                         include['bytes'] / 1024.0))
+    return '\n'.join(lines)
+
+
+def write_includes(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
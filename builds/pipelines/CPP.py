@@ -1,6 +1,9 @@
 import os
 
 from buildcommand import BuildCommand
+from commandpreprocessor import append_arguments, command_arguments
+from fastlink import fast_linker
+from filelist import FileList
 
 
 class CPP:
@@ -11,47 +14,193 @@ class CPP:
 
     def compile(self, project_name, settings, files):
         commands = []
-        step_files = []
+        step_files = FileList()
+        dependency_index = settings.get('dependency-index')
+        remote_command = self.remote_step(settings)
+        template = self.compile_template(settings)
+        precompiled_header = []
+        if settings.get('precompiled-header'):
+            precompiled_header = [self.precompiled_header_path(settings, settings['precompiled-header']) + '.gch']
+        unity = settings.get('unity')
+        split_dwarf = self.split_dwarf(settings)
+        if unity is not None:
+            files = unity.batch(files, self.object_file, not settings.get('dry-run'))
         for project_file in files:
-            command, outfile = self.compile_step(project_name, settings, project_file)
-            if outfile in step_files:
+            command, outfile, depfile = self.compile_step(project_name, settings, project_file, template)
+            if not step_files.add(outfile):
                 continue
-            commands.append(BuildCommand(command, 'compile', project_file, project_file, outfile))
+            dependencies = dependency_index.get(outfile, depfile) if dependency_index else None
+            implicit_inputs = precompiled_header + (unity.members.get(project_file, []) if unity else [])
+            # The compile cache and remote workers only bring back the object, not the split debug information
+            preprocess_command = None if split_dwarf else self.preprocess_step(command, outfile)
+            commands.append(BuildCommand(command, 'compile', project_file, project_file, outfile,
+                                         dependencies, depfile, preprocess_command,
+                                         remote_command, response_files=True, implicit_inputs=implicit_inputs))
+        return commands, step_files.to_list()
+
+    def precompile(self, project_name, settings, files):
+        commands = []
+        step_files = []
+        dependency_index = settings.get('dependency-index')
+        for header in files:
+            command, infile, outfile, depfile = self.precompile_step(project_name, settings, header)
+            dependencies = dependency_index.get(outfile, depfile) if dependency_index else None
+            commands.append(BuildCommand(command, 'precompile', header, infile, outfile, dependencies, depfile))
             step_files.append(outfile)
         return commands, step_files
 
-    def compile_step(self, project_name, settings, project_file):
-        include_paths = ['-I' + inc for inc in settings['include-paths']]
-        command = settings.get('tool') + " " + " ".join(
-            str(x) for x in settings.get('arguments')
-        ) + " " + " ".join(include_paths)
-        command = self.command_processor.Process(command, project_file)
-        outfile = project_file + ".o"
-        return command, outfile
+    def precompiled_header_path(self, settings, header):
+        """Returns the header the precompiled header of the target is built from and named after. It only includes
+        the project header and lives in the target state directory, so that every target has its own precompiled
+        header and the flags of debug and release builds never mix."""
+        return os.path.join(settings['target-directory'] + '.pch', os.path.basename(header))
+
+    def write_forwarding_header(self, path, header):
+        content = '#include "' + os.path.abspath(header).replace('\\', '/') + '"\n'
+        try:
+            with open(path, mode='r', encoding='utf-8') as file:
+                if file.read() == content:
+                    return
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+    def precompile_step(self, project_name, settings, header):
+        infile = self.precompiled_header_path(settings, header)
+        if not settings.get('dry-run'):
+            self.write_forwarding_header(infile, header)
+        command = command_arguments(settings.get('tool'), settings.get('arguments'), settings.get('shell', False))
+        command = self.command_processor.Process(command, header)
+        outfile = infile + '.gch'
+        depfile = outfile + '.d'
+        command = append_arguments(command, ['-I' + inc for inc in settings['include-paths']] + [
+            '-x', 'c++-header', infile, '-o', outfile, '-MMD', '-MF', depfile
+        ])
+        return command, infile, outfile, depfile
+
+    def compile_template(self, settings):
+        """Returns the compile command with $FILE standing for the source file"""
+        command = command_arguments(settings.get('tool'), settings.get('arguments'), settings.get('shell', False))
+        command = append_arguments(command, ['-I' + inc for inc in settings['include-paths']])
+        if settings.get('precompiled-header'):
+            header = self.precompiled_header_path(settings, settings['precompiled-header'])
+            command = append_arguments(command, ['-include', header, '-Winvalid-pch'])
+        if self.split_dwarf(settings):
+            command = append_arguments(command, ['-gsplit-dwarf'])
+        return command
+
+    def compile_step(self, project_name, settings, project_file, template=None):
+        if template is None:
+            template = self.compile_template(settings)
+        command = self.command_processor.Process(template, project_file)
+        outfile = self.object_file(project_file)
+        depfile = outfile + ".d"
+        command = append_arguments(command, ['-MMD', '-MF', depfile])
+        return command, outfile, depfile
+
+    def object_file(self, project_file):
+        return project_file + ".o"
+
+    def preprocess_step(self, command, outfile):
+        """Turns a compile command into one writing the preprocessed source to stdout, used as compile cache key"""
+        if isinstance(command, str):
+            output_argument = ' -o ' + outfile
+            if output_argument not in command:
+                return None
+            return command.replace(output_argument, ' -E -o -', 1)
+        for position in range(len(command) - 1):
+            if command[position] == '-o' and command[position + 1] == outfile:
+                return command[:position] + ['-E', '-o', '-'] + command[position + 2:]
+        return None
+
+    def remote_step(self, settings):
+        """Returns the compile command template used by remote workers on preprocessed sources, steps run by the
+        shell are only compiled locally"""
+        if settings.get('shell', False):
+            return None
+        command = command_arguments(settings.get('tool'), settings.get('arguments'))
+        return self.command_processor.Process(command, '$FILE')
+
+    def archive(self, project_name, settings, files):
+        """Archives the objects of every directory into a static library of its own, updating only the members whose
+        objects changed"""
+        directories = {}
+        for object_file in files:
+            directories.setdefault(os.path.dirname(object_file), FileList()).add(object_file)
+        command = command_arguments(settings.get('tool'), settings.get('arguments'))
+        command = self.command_processor.Process(command, project_name)
+        commands = []
+        step_files = []
+        for directory, objects in directories.items():
+            outfile = self.archive_file(project_name, directory)
+            commands.append(BuildCommand(append_arguments(command, [outfile] + objects.to_list()), 'archive',
+                                         outfile, None, outfile, objects.to_list(), response_files=True,
+                                         incremental=True))
+            step_files.append(outfile)
+        return commands, step_files
+
+    def archive_file(self, project_name, directory):
+        """Returns the static library of a directory, named after its path so that every directory gets its own"""
+        name = directory.replace(os.sep, '_').replace('/', '_').strip('._') or project_name
+        return os.path.join(directory, 'lib' + name + ".a")
 
     def build(self, project_name, settings, files):
-        oFiles = []
-        newestOFile = ''
-        newestOFileTime = 0
-        for currentFile in files:
-            currentFile = currentFile + '.o'
-            if currentFile not in oFiles:
-                oFiles.append(currentFile)
-                fileTime = os.path.getmtime(currentFile)
-                if fileTime > newestOFileTime:
-                    newestOFile = currentFile
-                    newestOFileTime = fileTime
+        oFiles = FileList(files).to_list()
+        link_files = oFiles
+        archives = [path for path in oFiles if path.endswith('.a')]
+        if archives:
+            # Every member is linked, as it would be without archives, so that objects only registering themselves
+            # in static initializers are kept
+            link_files = [path for path in oFiles if not path.endswith('.a')] + \
+                ['-Wl,--whole-archive'] + archives + ['-Wl,--no-whole-archive']
         libraries = ['-l' + lib for lib in settings['libraries']]
         library_paths = ['-L' + lib for lib in settings['library-paths']]
         shared_library_paths = ['-Wl,-rpath,' + slib for slib in settings['shared-library-paths']]
-        command = settings.get('tool') + " " + " ".join(library_paths) + " " + " ".join(shared_library_paths) + " " + " ".join(libraries) + " " + " ".join(str(x) for x in settings.get('arguments')) + " " + " ".join(str(x) for x in oFiles)
+        command = command_arguments(settings.get('tool'), settings.get('arguments'), settings.get('shell', False))
         command = self.command_processor.Process(command, project_name)
-        commands = [BuildCommand(command, 'build', project_name, newestOFile, project_name)]
+        linker = None
+        if settings.get('fast-link') and not settings.get('shell', False):
+            linker = fast_linker(settings.get('tool'), self.linker_cache_path(settings),
+                                 not settings.get('dry-run'))
+        link_inputs = library_paths + shared_library_paths + link_files + libraries
+        default_link = None
+        if linker is not None:
+            default_link = self.default_link(project_name, settings, append_arguments(command, link_inputs))
+            command = append_arguments(command, ['-fuse-ld=' + linker] + self.fast_link_arguments(settings))
+        command = append_arguments(command, link_inputs)
+        commands = [BuildCommand(command, 'build', project_name, None, project_name, oFiles,
+                                 response_files=True, linker=linker, default_link=default_link)]
         step_files = [project_name]
         return commands, step_files
 
-    def get_default_pipeline(self):
-        return [
+    def split_dwarf(self, settings):
+        """Targets with split-dwarf keep their debug information out of the objects the linker reads"""
+        return settings.get('split-dwarf', False)
+
+    def fast_link_arguments(self, settings):
+        """Returns the link arguments of fast linking, a gdb index built by the linker for debug targets so that gdb
+        does not have to index the debug information on every start"""
+        return ['-Wl,--gdb-index'] if settings.get('debug') or self.split_dwarf(settings) else []
+
+    def default_link(self, project_name, settings, command):
+        """Returns the link with the default linker into a scratch file, run once to time the default linker so that
+        the fast linker has a link time to be compared to"""
+        scratch = settings['target-directory'] + '.default-link'
+        for position in range(len(command) - 1):
+            if command[position] == '-o' and command[position + 1] == project_name:
+                return BuildCommand(command[:position + 1] + [scratch] + command[position + 2:], 'build',
+                                    project_name + ' with the default linker', None, scratch, response_files=True)
+        return None
+
+    def linker_cache_path(self, settings):
+        return os.path.join(os.path.dirname(settings['target-directory']), 'linkers.json')
+
+    def get_default_pipeline(self, precompiled_header=None, archives=False):
+        """Returns the default steps, with a step building the precompiled header before compiling when the project
+        has one, and a step archiving the objects of every directory before linking when asked to"""
+        steps = [
             {
                 "arguments": [
                     "-Wall",
@@ -72,4 +221,29 @@ class CPP:
                 "type": "build"
             }
         ]
-
+        if archives:
+            steps[1]['input'] = 'archives'
+            steps.insert(1, {
+                "arguments": [
+                    "rcsD"
+                ],
+                "input": "compiled-files",
+                "output": "archives",
+                "target-arguments": False,
+                "tool": "ar",
+                "type": "archive"
+            })
+        if precompiled_header:
+            steps[0]['precompiled-header'] = precompiled_header
+            steps[0]['requires'] = ['precompiled-headers']
+            steps.insert(0, {
+                "arguments": [
+                    "-Wall"
+                ],
+                "files": [precompiled_header],
+                "input": "precompiled-header",
+                "output": "precompiled-headers",
+                "tool": "g++",
+                "type": "precompile"
+            })
+        return steps
@@ -1 +1 @@
-__all__ = ["CPP", "CPPEvents"]
+__all__ = ["CPP", "MINGW"]
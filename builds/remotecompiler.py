@@ -0,0 +1,115 @@
+import os
+import socket
+import threading
+
+from commandpreprocessor import command_text
+from worker import DEFAULT_WORKER_PORT, ProtocolError, receive_message, send_message
+
+MAX_WORKER_FAILURES = 3
+
+
+def parse_workers(workers):
+    """Parses a host:port,host:port worker list"""
+    addresses = []
+    for worker in workers.split(','):
+        worker = worker.strip()
+        if not worker:
+            continue
+        host, _, port = worker.rpartition(':')
+        if not host:
+            host, port = port, DEFAULT_WORKER_PORT
+        addresses.append((host, int(port)))
+    return addresses
+
+
+class RemoteWorker:
+    def __init__(self, address):
+        self.address = address
+        self.name = address[0] + ':' + str(address[1])
+        self.slots = 0
+        self.busy = 0
+        self.failures = 0
+
+    def alive(self):
+        return self.slots > 0 and self.failures < MAX_WORKER_FAILURES
+
+
+class RemoteCompiler:
+    """Ships preprocessed compile jobs to workers started with `builds worker`. A job runs remotely when a worker
+    slot is free, otherwise locally, and falls back to compiling locally if the worker fails."""
+
+    def __init__(self, workers, token=None, timeout=600):
+        self.workers = [RemoteWorker(address) for address in parse_workers(workers)]
+        self.token = token
+        self.timeout = timeout
+        self.remote_jobs = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+    def request(self, worker, header, payload=b''):
+        with socket.create_connection(worker.address, timeout=10) as sock:
+            sock.settimeout(self.timeout)
+            send_message(sock, dict(header, token=self.token or ''), payload)
+            return receive_message(sock)
+
+    def connect(self):
+        """Asks every worker for its slot count, returns the number of remote slots available"""
+        for worker in self.workers:
+            try:
+                header, payload = self.request(worker, {'type': 'info'})
+                worker.slots = int(header.get('slots', 0))
+            except (OSError, ProtocolError, ValueError):
+                worker.slots = 0
+        return sum(worker.slots for worker in self.workers if worker.alive())
+
+    def acquire(self):
+        """Returns a worker with a free slot, or None when every worker is busy"""
+        with self.lock:
+            for worker in self.workers:
+                if worker.alive() and worker.busy < worker.slots:
+                    worker.busy += 1
+                    return worker
+        return None
+
+    def release(self, worker):
+        with self.lock:
+            worker.busy -= 1
+
+    def compile(self, worker, command, pipeline_configuration):
+        """Compiles on a worker, returns the success of the command or None when the worker failed"""
+        preprocessed = command.preprocess()
+        if preprocessed is None:
+            with self.lock:
+                self.fallbacks += 1
+            return None
+        command.print_status(pipeline_configuration, command.commandtype)
+        if pipeline_configuration.get('verbose', False):
+            command.print_line(worker.name + ': ' + command_text(command.remote_command))
+        header = {
+            'type': 'compile',
+            'command': command.remote_command,
+            'output': command.outfile.replace(command.infile, '$FILE', 1)
+        }
+        try:
+            response, output = self.request(worker, header, preprocessed)
+        except (OSError, ProtocolError):
+            response, output = {'error': 'Connection failed'}, b''
+        if 'error' in response:
+            with self.lock:
+                worker.failures += 1
+                self.fallbacks += 1
+            return None
+        if response.get('returncode') == 0:
+            temporary = command.outfile + '.remote'
+            with open(temporary, 'wb') as file:
+                file.write(output)
+            os.replace(temporary, command.outfile)
+        with self.lock:
+            worker.failures = 0
+            self.remote_jobs += 1
+        return command.finish(
+            pipeline_configuration,
+            response.get('returncode', 1),
+            response.get('stdout', '').encode('utf-8'),
+            response.get('stderr', '').encode('utf-8')
+        )
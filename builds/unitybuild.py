@@ -0,0 +1,172 @@
+import json
+import os
+
+from filelist import FileList
+
+SPLIT_FACTOR = 2
+
+
+class UnityBuild:
+    """Groups the sources of the compile step into unity sources that include several of them, so that the headers
+    they share are parsed once per batch. Batches are filled up to a budget of compile seconds learned from the build
+    history and are kept between builds: removed files leave their batch, new files join the newest batch and only
+    batches grown to twice the budget are split, so editing the file list does not move files between the other
+    batches and their objects stay up to date. Files failing to compile in a batch are isolated and compiled on their
+    own from then on."""
+
+    def __init__(self, path, directory, budget, history):
+        self.path = path
+        self.directory = directory
+        self.budget = budget
+        self.history = history
+        self.batches = {}
+        self.isolated = FileList()
+        self.next = 0
+        self.members = {}
+        self.object_file = None
+        self.written = []
+        self.isolated_now = []
+        self.changed = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                state = json.load(file)
+        except ValueError:
+            return
+        self.isolated = FileList(state.get('isolated', []))
+        self.next = state.get('next', 0)
+        if state.get('budget') == self.budget:
+            self.batches = state.get('batches', {})
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'budget': self.budget,
+                'next': self.next,
+                'batches': self.batches,
+                'isolated': self.isolated.to_list()
+            }, file, separators=(',', ':'))
+        self.changed = False
+
+    def cost(self, outfile):
+        return self.history.expected_output(outfile, 'compile', 'duration', 1.0)
+
+    def new_batch(self, batches):
+        name = 'unity_' + str(self.next)
+        self.next += 1
+        batches[name] = []
+        return name
+
+    def batch(self, files, object_file, write=True):
+        """Returns the files to compile, with the unity source of a batch in place of its files, and writes the
+        unity sources unless write is False. object_file(file) returns the object a file compiles to on its own,
+        whose compile time is the cost of the file."""
+        wanted = FileList(file for file in files if file not in self.isolated)
+        assigned = set()
+        batches = {}
+        for name, members in self.batches.items():
+            members = [member for member in members if member in wanted and member not in assigned]
+            assigned.update(members)
+            if members:
+                batches[name] = members
+        costs = {file: self.cost(object_file(file)) for file in wanted}
+        for name in list(batches):
+            members = batches[name]
+            total = sum(costs[member] for member in members)
+            if len(members) < 2 or total <= SPLIT_FACTOR * self.budget:
+                continue
+            cumulative = 0.0
+            for position, member in enumerate(members):
+                cumulative += costs[member]
+                if cumulative >= total / 2:
+                    break
+            split = max(1, min(position + 1, len(members) - 1))
+            batches[name] = members[:split]
+            batches[self.new_batch(batches)] = members[split:]
+        newest = max(batches, key=lambda name: int(name.split('_')[-1]), default=None)
+        filled = sum(costs[member] for member in batches[newest]) if newest else 0.0
+        for file in wanted:
+            if file in assigned:
+                continue
+            if newest is None or (filled > 0 and filled + costs[file] > self.budget):
+                newest = self.new_batch(batches)
+                filled = 0.0
+            batches[newest].append(file)
+            filled += costs[file]
+        if batches != self.batches:
+            self.batches = batches
+            self.changed = True
+
+        self.members = {}
+        self.object_file = object_file
+        self.written = []
+        sources = {}
+        for name, members in batches.items():
+            if len(members) < 2:
+                continue
+            source = os.path.join(self.directory, name + '.cpp')
+            if write and write_unity_source(source, members):
+                self.written.append(source)
+            self.members[source] = members
+            for member in members:
+                sources[member] = source
+        return FileList(sources.get(file, file) for file in files).to_list()
+
+    def record(self, command):
+        """Gives every member of a compiled unity source a share of its compile time in proportion to the cost of
+        the member, so that files keep a cost of their own and the next builds find the batches within budget"""
+        members = self.members.get(command.infile)
+        if not members:
+            return
+        self.history.update(command, unity=True)
+        costs = [self.cost(self.object_file(member)) for member in members]
+        total = sum(costs)
+        for member, cost in zip(members, costs):
+            share = command.duration * cost / total if total > 0 else command.duration / len(members)
+            self.history.update_output(self.object_file(member), type='compile', duration=share)
+
+    def isolate_failed(self, command):
+        """Takes the files causing the errors of a failed unity source out of their batch, or every file of the batch
+        when the errors can not be traced back to them. Returns the isolated files."""
+        members = self.members.get(command.infile)
+        if not members:
+            return []
+        paths = {os.path.abspath(member): member for member in members}
+        failing = FileList()
+        for diagnostic in command.diagnostics:
+            if diagnostic['severity'] != 'error':
+                continue
+            # The include chain goes from the innermost header out, the first batch member in it is the culprit
+            for place in [diagnostic] + diagnostic['context']:
+                if place.get('file') and os.path.abspath(place['file']) in paths:
+                    failing.add(paths[os.path.abspath(place['file'])])
+                    break
+        isolated = self.isolated.add_all(failing if len(failing) else members)
+        if isolated:
+            self.isolated_now.extend(isolated)
+            self.changed = True
+        return isolated
+
+
+def write_unity_source(path, members):
+    """Writes a unity source including the members, returns False when it already was up to date"""
+    content = ''.join('#include "' + os.path.abspath(member).replace('\\', '/') + '"\n' for member in members)
+    try:
+        with open(path, mode='r', encoding='utf-8') as file:
+            if file.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    return True
@@ -0,0 +1,71 @@
+import os
+import time
+
+from termcolor import colored
+
+
+class WatchBuild:
+    """Keeps a build pipeline warm between the builds of watch mode. The configuration, the build graph and the stat
+    and hash state of the files stay in memory, so a build after a save only looks again at the changed files,
+    compiles the translation units affected by them and links. create_pipeline() returns a new pipeline and the
+    project files, and is called again when the configuration file changes. finished(pipeline, wall) is called
+    after every build."""
+
+    def __init__(self, create_pipeline, configuration_path, finished=None):
+        self.create_pipeline = create_pipeline
+        self.configuration_path = os.path.normpath(configuration_path)
+        self.finished = finished
+        self.pipeline = None
+        self.files = []
+        self.watched = {}
+
+    def is_watched(self, path):
+        path = os.path.normpath(path)
+        return path == self.configuration_path or path in self.watched
+
+    def update_watched(self):
+        """Watches the inputs of every command that are not written by the build itself"""
+        outputs = set(os.path.normpath(command.outfile) for command in self.pipeline.graph.commands)
+        watched = {}
+        for command in self.pipeline.graph.commands:
+            for path in command.inputs():
+                normalized = os.path.normpath(path)
+                if normalized not in outputs:
+                    watched.setdefault(normalized, []).append(path)
+        self.watched = watched
+
+    def start(self):
+        self.pipeline, self.files = self.create_pipeline()
+        self.build(time.monotonic())
+
+    def files_changed(self, paths, saved):
+        changed = []
+        reload = False
+        for path in paths:
+            normalized = os.path.normpath(path)
+            if normalized == self.configuration_path:
+                reload = True
+            changed.extend(self.watched.get(normalized, []))
+        if reload:
+            print(colored('Configuration changed, reloading', 'yellow'))
+            self.pipeline, self.files = self.create_pipeline()
+        elif not changed:
+            return
+        else:
+            self.pipeline.invalidate(changed)
+        self.build(saved)
+
+    def build(self, saved):
+        pipeline = self.pipeline
+        pipeline.run(self.files)
+        wall = time.monotonic() - saved
+        self.update_watched()
+        if self.finished is not None:
+            self.finished(pipeline, wall)
+        if pipeline.run_command_errors:
+            print(colored('Build failed', 'red') + ' after ' + '%.2f' % wall + 's, waiting for changes')
+        elif pipeline.executed_commands:
+            print(colored('Built', 'green') + ' in ' + '%.2f' % wall + 's from save, ' +
+                  str(pipeline.executed_commands) + ' commands run')
+        else:
+            print(colored('Up to date', 'green') + ', waiting for changes')
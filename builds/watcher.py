@@ -1,4 +1,5 @@
 import logging
+import threading
 import time
 
 from termcolor import colored
@@ -7,48 +8,84 @@ from watchdog.observers import Observer
 
 
 class WatchEventHandler(FileSystemEventHandler):
-    def __init__(self, files_list, build_callback_object):
-        self.files_list = files_list
-        self.build = build_callback_object
+    def __init__(self, watcher):
+        self.watcher = watcher
         super(WatchEventHandler, self).__init__()
-    
+
     def on_moved(self, event):
         super(WatchEventHandler, self).on_moved(event)
 
         what = 'directory' if event.is_directory else 'file'
-        logging.info("Moved %s: from %s to %s", what, event.src_path,
-                     event.dest_path)
+        logging.debug("Moved %s: from %s to %s", what, event.src_path,
+                      event.dest_path)
+        if not event.is_directory:
+            self.watcher.file_changed(event.dest_path)
 
     def on_created(self, event):
         super(WatchEventHandler, self).on_created(event)
 
         what = 'directory' if event.is_directory else 'file'
-        logging.info("Created %s: %s", what, event.src_path)
+        logging.debug("Created %s: %s", what, event.src_path)
+        if not event.is_directory:
+            self.watcher.file_changed(event.src_path)
 
     def on_deleted(self, event):
         super(WatchEventHandler, self).on_deleted(event)
 
         what = 'directory' if event.is_directory else 'file'
-        logging.info("Deleted %s: %s", what, event.src_path)
+        logging.debug("Deleted %s: %s", what, event.src_path)
+        if not event.is_directory:
+            self.watcher.file_changed(event.src_path)
 
     def on_modified(self, event):
         super(WatchEventHandler, self).on_modified(event)
 
         what = 'directory' if event.is_directory else 'file'
-        logging.info("Modified %s: %s", what, event.src_path)
-        if event.src_path in self.files_list and self.build is not None:
-            self.build.file_modified(event.src_path)
+        logging.debug("Modified %s: %s", what, event.src_path)
+        if not event.is_directory:
+            self.watcher.file_changed(event.src_path)
 
 
 class Watcher:
     """The watcher class that will watch over changes in the CWD if any of the project files change, and will build
-    them. """
-    def __init__(self, files_list, build_callback_object):
-        self.handler = WatchEventHandler(files_list, build_callback_object)
+    them. Changes are collected until no file has changed for debounce seconds, so that the burst of writes of an
+    editor save results in a single build. The build callback object decides which paths are watched with
+    is_watched(path), is started with start() once the directory is watched and is called with
+    files_changed(paths, saved), saved being the time of the first change."""
+    def __init__(self, build_callback_object, debounce=0.1):
+        self.build = build_callback_object
+        self.debounce = debounce
+        self.handler = WatchEventHandler(self)
+        self.condition = threading.Condition()
+        self.changed = set()
+        self.first_change = None
+        self.last_change = None
+
+    def file_changed(self, path):
+        if self.build is not None and not self.build.is_watched(path):
+            return
+        with self.condition:
+            now = time.monotonic()
+            if not self.changed:
+                self.first_change = now
+            self.changed.add(path)
+            self.last_change = now
+            self.condition.notify()
+
+    def wait_for_changes(self):
+        """Waits until files changed and then stayed untouched for the debounce time, returns the changed paths
+        and the time of the first change"""
+        with self.condition:
+            while not self.changed or time.monotonic() < self.last_change + self.debounce:
+                timeout = 1.0 if not self.changed else self.last_change + self.debounce - time.monotonic()
+                self.condition.wait(max(0.0, timeout))
+            changed, first_change = self.changed, self.first_change
+            self.changed = set()
+            return changed, first_change
 
-    def start(self):
+    def start(self, verbose=False):
         print(colored('Started to watch the current directory.', 'green'))
-        logging.basicConfig(level=logging.INFO,
+        logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO,
                             format='%(asctime)s - %(message)s',
                             datefmt='%Y-%m-%d %H:%M:%S')
         event_handler = self.handler
@@ -56,8 +93,12 @@ class Watcher:
         observer.schedule(event_handler, '.', recursive=True)
         observer.start()
         try:
+            if self.build is not None:
+                self.build.start()
             while True:
-                time.sleep(1)
+                changed, saved = self.wait_for_changes()
+                if self.build is not None:
+                    self.build.files_changed(changed, saved)
         except KeyboardInterrupt:
             observer.stop()
         observer.join()
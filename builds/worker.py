@@ -0,0 +1,135 @@
+import hmac
+import json
+import multiprocessing
+import os
+import shlex
+import socketserver
+import struct
+import subprocess
+import tempfile
+import threading
+
+DEFAULT_WORKER_PORT = 7878
+DEFAULT_WORKER_TOOLS = ['g++', 'x86_64-w64-mingw32-g++']
+REJECTED_ARGUMENT_PREFIXES = ['-fplugin', '-specs', '-wrapper', '-B', '@']
+
+HEADER_SIZE = struct.Struct('>I')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ProtocolError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, header, payload=b''):
+    """Sends a message: length prefixed json header followed by header['size'] bytes of payload"""
+    header = dict(header, size=len(payload))
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER_SIZE.pack(len(encoded)) + encoded)
+    if payload:
+        sock.sendall(payload)
+
+
+def receive_message(sock):
+    (length,) = HEADER_SIZE.unpack(receive_exactly(sock, HEADER_SIZE.size))
+    try:
+        header = json.loads(receive_exactly(sock, length).decode('utf-8'))
+    except ValueError:
+        raise ProtocolError('Malformed header')
+    payload = receive_exactly(sock, header.get('size', 0))
+    return header, payload
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        try:
+            header, payload = receive_message(self.request)
+            if server.token and not hmac.compare_digest(str(header.get('token', '')), server.token):
+                send_message(self.request, {'error': 'Invalid token'})
+                return
+            if header.get('type') == 'info':
+                send_message(self.request, {'slots': server.jobs})
+            elif header.get('type') == 'compile':
+                with server.slots:
+                    response, output = server.compile(header, payload)
+                send_message(self.request, response, output)
+            else:
+                send_message(self.request, {'error': 'Unknown request'})
+        except (OSError, ProtocolError):
+            pass
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Serves compile jobs to `builds build --workers`. Jobs contain preprocessed source and a compile command
+    template where $FILE stands for the source file, and the compiled object is sent back."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, jobs=None, token=None, tools=None):
+        socketserver.TCPServer.__init__(self, address, WorkerHandler)
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.token = token
+        self.tools = tools or DEFAULT_WORKER_TOOLS
+        self.slots = threading.BoundedSemaphore(self.jobs)
+
+    def parse_command(self, template, source):
+        if isinstance(template, str):
+            template = shlex.split(template)
+        elif not isinstance(template, list) or not all(isinstance(argument, str) for argument in template):
+            raise ValueError('Command must be a string or a list of strings')
+        arguments = [argument.replace('$FILE', source) for argument in template]
+        if not arguments or arguments[0] not in self.tools:
+            raise ValueError('Tool not allowed: ' + (arguments[0] if arguments else ''))
+        for argument in arguments[1:]:
+            for prefix in REJECTED_ARGUMENT_PREFIXES:
+                if argument.startswith(prefix):
+                    raise ValueError('Argument not allowed: ' + argument)
+        return arguments
+
+    def compile(self, header, payload):
+        with tempfile.TemporaryDirectory(prefix='builds-worker-') as directory:
+            source = os.path.join(directory, 'source.ii')
+            output = header.get('output', '$FILE.o').replace('$FILE', source)
+            if os.path.dirname(os.path.abspath(output)) != directory:
+                return {'error': 'Output outside of the job directory'}, b''
+            try:
+                arguments = self.parse_command(header.get('command', ''), source)
+            except ValueError as e:
+                return {'error': str(e)}, b''
+            with open(source, 'wb') as file:
+                file.write(payload)
+            try:
+                result = subprocess.run(arguments, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except OSError as e:
+                return {'error': str(e)}, b''
+            response = {
+                'returncode': result.returncode,
+                'stdout': result.stdout.decode('utf-8', 'replace'),
+                'stderr': result.stderr.decode('utf-8', 'replace')
+            }
+            if result.returncode != 0 or not os.path.isfile(output):
+                return response, b''
+            with open(output, 'rb') as file:
+                return response, file.read()
+
+
+def serve(host, port, jobs=None, token=None, tools=None):
+    server = WorkerServer((host, port), jobs, token, tools)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()